@@ -1,17 +1,30 @@
 import os
-import json
 import logging
-from typing import List, Dict, Any
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
 from config import DEFAULT_API_PAIRS
+from utils.json_utils import loads as json_loads, JSONDecodeError
 
 logger = logging.getLogger(__name__)
 
 def get_api_credentials() -> List[Dict[str, Any]]:
     """
-    Load API credentials from environment variable or use defaults
+    Load API credentials from environment variable or use defaults.
+    The environment is only read and parsed once per process.
     """
+    # Fresh dicts, so a caller editing its credentials can't change the cached ones
+    return [dict(cred) for cred in _load_api_credentials()]
+
+@lru_cache(maxsize=1)
+def _load_api_credentials() -> Tuple[Dict[str, Any], ...]:
+    """
+    Parse and validate API_PAIRS_JSON (cached, see get_api_credentials)
+    """
+    return tuple(_parse_api_credentials())
+
+def _parse_api_credentials() -> List[Dict[str, Any]]:
     try:
-        api_pairs_json = os.getenv('API_PAIRS_JSON')
+        api_pairs_json = os.getenv('API_PAIRS_JSON', '')
         
         if not api_pairs_json:
             logger.warning("API_PAIRS_JSON environment variable not set")
@@ -19,8 +32,8 @@ def get_api_credentials() -> List[Dict[str, Any]]:
             logger.info(f"Using {len(DEFAULT_API_PAIRS)} default API credentials")
             return DEFAULT_API_PAIRS
         
-        # Parse JSON string
-        api_pairs = json.loads(api_pairs_json)
+        # Parse JSON string (as UTF-8 bytes, which orjson consumes directly)
+        api_pairs = json_loads(api_pairs_json.encode())
         
         # Validate structure
         if not isinstance(api_pairs, list):
@@ -32,12 +45,12 @@ def get_api_credentials() -> List[Dict[str, Any]]:
         # Validate each pair
         valid_pairs = []
         for i, pair in enumerate(api_pairs):
-            if isinstance(pair, dict) and 'api_id' in pair and 'api_hash' in pair:
+            try:
                 valid_pairs.append({
                     'api_id': int(pair['api_id']),
                     'api_hash': str(pair['api_hash'])
                 })
-            else:
+            except (TypeError, KeyError, ValueError):
                 logger.warning(f"Invalid API pair at index {i}: {pair}")
         
         if not valid_pairs:
@@ -49,7 +62,7 @@ def get_api_credentials() -> List[Dict[str, Any]]:
         logger.info(f"Loaded {len(valid_pairs)} valid API credentials from environment")
         return valid_pairs
         
-    except json.JSONDecodeError as e:
+    except JSONDecodeError as e:
         logger.error(f"Invalid JSON in API_PAIRS_JSON: {e}")
         # Fall back to defaults
         logger.info(f"Using {len(DEFAULT_API_PAIRS)} default API credentials")
@@ -78,6 +91,7 @@ def validate_api_credentials(api_id: int, api_hash: str) -> bool:
     except Exception:
         return False
 
+@lru_cache(maxsize=1)
 def get_credentials_count() -> int:
     """
     Get the number of available API credentials
@@ -88,9 +102,22 @@ def get_credentials_info() -> Dict[str, Any]:
     """
     Get information about available credentials
     """
-    credentials = get_api_credentials()
+    # The API ids are cached as a tuple; every caller gets its own dict and list
+    api_ids = _credential_api_ids()
     return {
-        "count": len(credentials),
-        "available": len(credentials) > 0,
-        "api_ids": [cred['api_id'] for cred in credentials] if credentials else []
-    } 
\ No newline at end of file
+        "count": len(api_ids),
+        "available": len(api_ids) > 0,
+        "api_ids": list(api_ids)
+    }
+
+@lru_cache(maxsize=1)
+def _credential_api_ids() -> Tuple[int, ...]:
+    return tuple(cred['api_id'] for cred in _load_api_credentials())
+
+def reload_api_credentials():
+    """
+    Drop all cached credential data so the environment is re-read on next use
+    """
+    _load_api_credentials.cache_clear()
+    get_credentials_count.cache_clear()
+    _credential_api_ids.cache_clear()
@@ -9,6 +9,19 @@ DEBUG = os.getenv('DEBUG', 'true').lower() == 'true'
 # Logging Configuration
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 
+# Maximum number of sessions processed concurrently, across all requests
+TELEGRAM_CONCURRENCY = int(os.getenv('TELEGRAM_CONCURRENCY', 16))
+
+# Worker tasks per health check request
+HEALTH_CHECK_WORKERS = int(os.getenv('HEALTH_CHECK_WORKERS', 10))
+
+# Largest request body accepted by the session-only upload endpoints
+SESSION_UPLOAD_MAX_BYTES = int(os.getenv('SESSION_UPLOAD_MAX_BYTES', 100 * 1024 * 1024))
+
+# Seconds a pooled Telegram client may stay connected without being used
+CLIENT_POOL_IDLE_SECONDS = int(os.getenv('CLIENT_POOL_IDLE_SECONDS', 300))
+CLIENT_POOL_MAX_SIZE = int(os.getenv('CLIENT_POOL_MAX_SIZE', 100))
+
 # API Credentials Template
 # Replace these with your actual Telegram API credentials
 DEFAULT_API_PAIRS = [
@@ -26,13 +39,7 @@ def get_api_pairs() -> List[Dict[str, Any]]:
     """
     Get API pairs from environment or return defaults
     """
-    api_pairs_json = os.getenv('API_PAIRS_JSON')
-    
-    if api_pairs_json:
-        try:
-            import json
-            return json.loads(api_pairs_json)
-        except:
-            pass
-    
-    return DEFAULT_API_PAIRS 
\ No newline at end of file
+    # Parsing, validation and caching live in api_pool; imported lazily
+    # because api_pool itself imports DEFAULT_API_PAIRS from this module
+    from api_pool import get_api_credentials
+    return get_api_credentials()
@@ -1,5 +1,6 @@
 from fastapi import FastAPI, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from routers import (
     zip_handler,
     validator,
@@ -13,6 +14,9 @@ from routers import (
     folder_join
 )
 from utils.websocket_manager import websocket_manager
+from utils.client_pool import client_pool
+from utils.upload_limit import SessionUploadLimitMiddleware
+from config import SESSION_UPLOAD_MAX_BYTES, TELEGRAM_CONCURRENCY
 import logging
 
 # Configure logging
@@ -22,7 +26,25 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Session Web 2.0 API",
     description="API for managing Telegram sessions and performing various operations",
-    version="2.0.0"
+    version="2.0.0",
+    # orjson serializes the large batch result bodies several times faster
+    default_response_class=ORJSONResponse
+)
+
+# Endpoints whose uploads are session files (pfp adds one small image).
+# /zip/ is left out on purpose: whole archives of sessions are expected to be large
+SESSION_UPLOAD_PREFIXES = (
+    "/folder/", "/health/", "/login_code/", "/auth_code/",
+    "/bio/", "/name/", "/validate/", "/pfp/"
+)
+
+# Pure ASGI, so other requests and streamed responses such as /zip/extract_tar pass straight through.
+# Added before CORS: the last middleware added is the outermost, so CORSMiddleware
+# wraps this one and its 413 carries the Access-Control headers the frontend needs
+app.add_middleware(
+    SessionUploadLimitMiddleware,
+    prefixes=SESSION_UPLOAD_PREFIXES,
+    max_bytes=SESSION_UPLOAD_MAX_BYTES
 )
 
 # Add CORS middleware
@@ -46,6 +68,11 @@ app.include_router(auth_code.router, prefix="/auth_code", tags=["auth_code"])
 app.include_router(stream.router, prefix="/stream", tags=["stream"])
 app.include_router(folder_join.router, prefix="/folder", tags=["folder"])
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Disconnect pooled Telegram clients"""
+    await client_pool.close()
+
 # WebSocket endpoint for real-time updates
 @app.websocket("/ws/stream")
 async def websocket_endpoint(websocket: WebSocket):
@@ -95,6 +122,10 @@ async def root():
             "stream": "/stream",
             "folder": "/folder",
             "websocket": "/ws/{task_id}"
+        },
+        "limits": {
+            # Sessions talking to Telegram at once, shared by all batch endpoints
+            "telegram_concurrency": TELEGRAM_CONCURRENCY
         }
     }
 
@@ -2,14 +2,27 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from typing import List, Dict
 import asyncio
 import logging
-from utils.session_utils import create_telegram_client
+import re
+from utils.session_utils import save_session_upload, gather_unique_uploads
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
+from utils.error_handler import classify_error, SESSION_ERROR_RULES
 from utils.logger import log_to_websocket
-from io import BytesIO
 from telethon.tl.functions.account import UpdateProfileRequest
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# (pattern, error_type, description) rules, checked in order against the
+# lowercased error message; the first match wins
+_BIO_UPDATE_ERRORS = (
+    (re.compile(r'flood|wait'), "flood_wait", "Rate limited - too many profile updates"),
+    (re.compile(r'banned|blocked'), "banned", "Account is banned or blocked"),
+    (re.compile(r'deleted|removed'), "deleted", "Account has been deleted"),
+    (re.compile(r'network|connection'), "network_error", "Network connection failed"),
+    (re.compile(r'about|bio'), "bio_error", "Invalid bio format or length"),
+)
+
 @router.post("/set")
 async def set_bios(
     files: List[UploadFile] = File(...),
@@ -18,21 +31,33 @@ async def set_bios(
     """
     Set bio for multiple sessions
     """
-    results = []
+    session_files = [file for file in files if file.filename.endswith('.session')]
     
-    for file in files:
-        if not file.filename.endswith('.session'):
-            continue
-            
+    # Sessions are independent and network-bound, so update them concurrently;
+    # re-uploads of the same session are only updated once
+    semaphore = telegram_semaphore()
+    results = await gather_unique_uploads(
+        session_files, lambda file: _set_bio(file, bio_text, semaphore)
+    )
+    
+    return {
+        "message": f"Updated bios for {len(results)} sessions",
+        "results": results,
+        "total_sessions": len(results)
+    }
+
+async def _set_bio(file: UploadFile, bio_text: str, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Set bio for a single session and return its result entry
+    """
+    async with semaphore:
+        client = None
         try:
-            session_content = await file.read()
-            session_buffer = BytesIO(session_content)
+            # Copy the upload to disk instead of buffering it in memory
+            session_path = await save_session_upload(file)
             
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, file.filename)
-            
-            # Try to connect and update bio
-            await client.connect()
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, file.filename)
             
             if await client.is_user_authorized():
                 try:
@@ -44,108 +69,51 @@ async def set_bios(
                         about=bio_text
                     ))
                     
-                    results.append({
+                    await log_to_websocket(f"✅ {file.filename}: Bio updated to '{bio_text[:50]}...'")
+                    return {
                         "session": file.filename,
                         "status": "success",
                         "old_bio": me.about,
                         "new_bio": bio_text,
                         "user_id": me.id
-                    })
-                    
-                    await log_to_websocket(f"✅ {file.filename}: Bio updated to '{bio_text[:50]}...'")
+                    }
                     
                 except Exception as e:
-                    error_msg = str(e).lower()
-                    
-                    # Determine specific error type for bio updates
-                    if "flood" in error_msg or "wait" in error_msg:
-                        error_type = "flood_wait"
-                        error_description = "Rate limited - too many profile updates"
-                    elif "banned" in error_msg or "blocked" in error_msg:
-                        error_type = "banned"
-                        error_description = "Account is banned or blocked"
-                    elif "deleted" in error_msg or "removed" in error_msg:
-                        error_type = "deleted"
-                        error_description = "Account has been deleted"
-                    elif "network" in error_msg or "connection" in error_msg:
-                        error_type = "network_error"
-                        error_description = "Network connection failed"
-                    elif "about" in error_msg or "bio" in error_msg:
-                        error_type = "bio_error"
-                        error_description = "Invalid bio format or length"
-                    else:
-                        error_type = "update_error"
-                        error_description = f"Bio update failed: {str(e)}"
+                    error_type, error_description = classify_error(
+                        e, _BIO_UPDATE_ERRORS, "update_error", "Bio update failed"
+                    )
                     
-                    results.append({
+                    await log_to_websocket(f"❌ {file.filename}: {error_description}")
+                    return {
                         "session": file.filename,
                         "status": "error",
                         "error_type": error_type,
                         "error": error_description,
                         "raw_error": str(e),
                         "user_id": None
-                    })
-                    await log_to_websocket(f"❌ {file.filename}: {error_description}")
+                    }
             else:
-                results.append({
+                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                return {
                     "session": file.filename,
                     "status": "unauthorized",
                     "error": "Session not authorized",
                     "user_id": None
-                })
-                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                }
                 
         except Exception as e:
-            error_msg = str(e).lower()
+            error_type, error_description = classify_error(e, SESSION_ERROR_RULES)
             
-            # Determine specific error type
-            if "session" in error_msg and ("expired" in error_msg or "invalid" in error_msg):
-                error_type = "session_expired"
-                error_description = "Session file is expired or invalid"
-            elif "flood" in error_msg or "wait" in error_msg:
-                error_type = "flood_wait"
-                error_description = "Rate limited - too many requests"
-            elif "banned" in error_msg or "blocked" in error_msg:
-                error_type = "banned"
-                error_description = "Account is banned or blocked"
-            elif "deleted" in error_msg or "removed" in error_msg:
-                error_type = "deleted"
-                error_description = "Account has been deleted"
-            elif "network" in error_msg or "connection" in error_msg:
-                error_type = "network_error"
-                error_description = "Network connection failed"
-            elif "auth" in error_msg or "unauthorized" in error_msg:
-                error_type = "unauthorized"
-                error_description = "Session not authorized"
-            else:
-                error_type = "unknown_error"
-                error_description = f"Unknown error: {str(e)}"
-            
-            results.append({
+            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            return {
                 "session": file.filename,
                 "status": "error",
                 "error_type": error_type,
                 "error": error_description,
                 "raw_error": str(e),
                 "user_id": None
-            })
-            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            }
             
         finally:
-            if 'client' in locals():
-                await client.disconnect()
-                # Clean up temp file if it exists
-                try:
-                    if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                        import os
-                        if os.path.exists(client.session.filename):
-                            os.unlink(client.session.filename)
-                            logger.info(f"Cleaned up temp file for {file.filename}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file for {file.filename}: {e}")
-    
-    return {
-        "message": f"Updated bios for {len(results)} sessions",
-        "results": results,
-        "total_sessions": len(results)
-    } 
\ No newline at end of file
+            if client is not None:
+                client_pool.release(client)
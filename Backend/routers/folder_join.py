@@ -1,24 +1,45 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
-from typing import List, Dict
+from typing import List, Dict, NamedTuple, Optional
 import asyncio
 import logging
 import re
-from utils.session_utils import create_telegram_client
+from collections import Counter
+from utils.session_utils import save_session_upload
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
 from utils.logger import log_to_websocket
-from io import BytesIO
 from telethon import functions
 from telethon.errors import SessionPasswordNeededError, FloodWaitError
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Uploads without this extension are rejected before anything is read or copied
+_SESSION_EXT = '.session'
+
+# Pattern to match t.me/addlist/slug
+_SLUG_RE = re.compile(r't\.me/addlist/([a-zA-Z0-9_-]+)')
+
+class JoinResult(NamedTuple):
+    """Outcome of joining the folder with one session"""
+    session: str
+    status: str
+    message: Optional[str] = None
+    error: Optional[str] = None
+    error_type: Optional[str] = None
+    folder_slug: Optional[str] = None
+    already_in_folder: Optional[bool] = None
+    wait_seconds: Optional[int] = None
+    
+    def to_dict(self) -> Dict:
+        """Response entry with the unset fields left out"""
+        return {field: value for field, value in zip(self._fields, self) if value is not None}
+
 def extract_slug_from_link(folder_link: str) -> str:
     """
     Extract slug from folder link like https://t.me/addlist/abc123
     """
-    # Pattern to match t.me/addlist/slug
-    pattern = r't\.me/addlist/([a-zA-Z0-9_-]+)'
-    match = re.search(pattern, folder_link)
+    match = _SLUG_RE.search(folder_link)
     
     if match:
         return match.group(1)
@@ -34,8 +55,6 @@ async def join_folder(
     """
     Join a folder/chatlist with multiple Telegram sessions
     """
-    results = []
-    
     # Extract slug from folder link
     try:
         slug = extract_slug_from_link(folder_link)
@@ -46,58 +65,95 @@ async def join_folder(
             detail=f"Invalid folder link format. Expected: https://t.me/addlist/slug or just slug"
         )
     
-    # Process each session file
-    for session_file in session_files:
+    # Sessions are independent and network-bound, so join them concurrently
+    semaphore = telegram_semaphore()
+    results = await asyncio.gather(*[
+        _join_one(session_file, slug, semaphore) for session_file in session_files
+    ])
+    
+    # Calculate summary in a single pass over the results
+    total_sessions = len(session_files)
+    status_counts = Counter()
+    error_type_counts = Counter()
+    already_in_folder = 0
+    for r in results:
+        status_counts[r.status] += 1
+        error_type_counts[r.error_type] += 1
+        if r.already_in_folder:
+            already_in_folder += 1
+    
+    successful_joins = status_counts["success"]
+    errors = status_counts["error"]
+    unauthorized = error_type_counts["unauthorized"]
+    flood_wait = error_type_counts["flood_wait"]
+    twofa_required = error_type_counts["twofa_required"]
+    
+    return {
+        "results": [r.to_dict() for r in results],
+        "summary": {
+            "total_sessions": total_sessions,
+            "successfully_joined": successful_joins,
+            "already_in_folder": already_in_folder,
+            "errors": errors,
+            "unauthorized": unauthorized,
+            "flood_wait": flood_wait,
+            "twofa_required": twofa_required
+        },
+        "folder_info": {
+            "slug": slug,
+            "link": folder_link
+        }
+    }
+
+async def _join_one(session_file: UploadFile, slug: str, semaphore: asyncio.Semaphore) -> JoinResult:
+    """
+    Join the folder with a single session and return its result
+    """
+    filename = session_file.filename
+    
+    # Validate session file
+    if not filename.endswith(_SESSION_EXT):
+        return JoinResult(
+            session=filename,
+            status="error",
+            error="Session file must have .session extension",
+            error_type="invalid_session"
+        )
+    
+    async with semaphore:
+        client = None
         try:
-            # Validate session file
-            if not session_file.filename.endswith('.session'):
-                results.append({
-                    "session": session_file.filename,
-                    "status": "error",
-                    "error": "Session file must have .session extension",
-                    "error_type": "invalid_session"
-                })
-                continue
-            
-            # Read session content once
-            session_content = await session_file.read()
-            session_buffer = BytesIO(session_content)
-            
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, session_file.filename)
+            # Copy the upload to disk instead of buffering it in memory
+            session_path = await save_session_upload(session_file)
             
             try:
-                # Connect to Telegram
-                await client.connect()
+                # Get a connected client (reused if this session is already pooled)
+                client = await client_pool.acquire(session_path, filename)
                 
                 # Check if authorized
                 if not await client.is_user_authorized():
-                    results.append({
-                        "session": session_file.filename,
-                        "status": "error",
-                        "error": "Session not authorized",
-                        "error_type": "unauthorized"
-                    })
-                    await client.disconnect()
-                    continue
+                    return JoinResult(
+                        session=filename,
+                        status="error",
+                        error="Session not authorized",
+                        error_type="unauthorized"
+                    )
                 
                 # Check the chatlist invite
-                logger.info(f"Checking chatlist invite for {session_file.filename}")
+                logger.info(f"Checking chatlist invite for {filename}")
                 chatlist_invite = await client(functions.chatlists.CheckChatlistInviteRequest(slug=slug))
                 
                 # Check if user is already in this chatlist by looking at the response
                 # If the response doesn't have 'peers', it usually means the user is already in the folder
                 if not hasattr(chatlist_invite, 'peers') or not chatlist_invite.peers:
-                    logger.info(f"Session {session_file.filename} appears to already be in folder: {slug}")
-                    results.append({
-                        "session": session_file.filename,
-                        "status": "info",
-                        "message": f"Session already has this folder: {slug}",
-                        "folder_slug": slug,
-                        "already_in_folder": True
-                    })
-                    await client.disconnect()
-                    continue
+                    logger.info(f"Session {filename} appears to already be in folder: {slug}")
+                    return JoinResult(
+                        session=filename,
+                        status="info",
+                        message=f"Session already has this folder: {slug}",
+                        folder_slug=slug,
+                        already_in_folder=True
+                    )
                 
                 # Join the chatlist using .peers directly
                 try:
@@ -106,95 +162,70 @@ async def join_folder(
                         peers=chatlist_invite.peers
                     ))
                     
-                    logger.info(f"Successfully joined folder for {session_file.filename}")
-                    results.append({
-                        "session": session_file.filename,
-                        "status": "success",
-                        "message": f"Successfully joined folder: {slug}",
-                        "folder_slug": slug,
-                        "already_in_folder": False
-                    })
+                    logger.info(f"Successfully joined folder for {filename}")
+                    result = JoinResult(
+                        session=filename,
+                        status="success",
+                        message=f"Successfully joined folder: {slug}",
+                        folder_slug=slug,
+                        already_in_folder=False
+                    )
                     
                 except Exception as e:
-                    logger.error(f"Error joining folder for {session_file.filename}: {e}")
+                    logger.error(f"Error joining folder for {filename}: {e}")
                     # Check if the error indicates the user is already in the folder
                     error_msg = str(e).lower()
                     if "already" in error_msg or "invite" in error_msg:
-                        results.append({
-                            "session": session_file.filename,
-                            "status": "info",
-                            "message": f"Session already has this folder: {slug}",
-                            "folder_slug": slug,
-                            "already_in_folder": True
-                        })
+                        result = JoinResult(
+                            session=filename,
+                            status="info",
+                            message=f"Session already has this folder: {slug}",
+                            folder_slug=slug,
+                            already_in_folder=True
+                        )
                     else:
-                        results.append({
-                            "session": session_file.filename,
-                            "status": "error",
-                            "error": str(e),
-                            "error_type": "folder_error"
-                        })
+                        result = JoinResult(
+                            session=filename,
+                            status="error",
+                            error=str(e),
+                            error_type="folder_error"
+                        )
                 
-                await client.disconnect()
+                return result
                 
             except FloodWaitError as e:
-                await client.disconnect()
-                results.append({
-                    "session": session_file.filename,
-                    "status": "error",
-                    "error": f"Flood wait: wait {e.seconds} seconds",
-                    "error_type": "flood_wait",
-                    "wait_seconds": e.seconds
-                })
+                return JoinResult(
+                    session=filename,
+                    status="error",
+                    error=f"Flood wait: wait {e.seconds} seconds",
+                    error_type="flood_wait",
+                    wait_seconds=e.seconds
+                )
                 
             except SessionPasswordNeededError:
-                await client.disconnect()
-                results.append({
-                    "session": session_file.filename,
-                    "status": "error",
-                    "error": "2FA enabled for this session. Enter password manually.",
-                    "error_type": "twofa_required"
-                })
+                return JoinResult(
+                    session=filename,
+                    status="error",
+                    error="2FA enabled for this session. Enter password manually.",
+                    error_type="twofa_required"
+                )
                 
             except Exception as e:
-                await client.disconnect()
-                results.append({
-                    "session": session_file.filename,
-                    "status": "error",
-                    "error": str(e),
-                    "error_type": "general_error"
-                })
+                return JoinResult(
+                    session=filename,
+                    status="error",
+                    error=str(e),
+                    error_type="general_error"
+                )
                 
         except Exception as e:
-            results.append({
-                "session": session_file.filename,
-                "status": "error",
-                "error": str(e),
-                "error_type": "general_error"
-            })
-    
-    # Calculate summary
-    total_sessions = len(session_files)
-    successful_joins = len([r for r in results if r["status"] == "success"])
-    already_in_folder = len([r for r in results if r.get("already_in_folder") == True])
-    errors = len([r for r in results if r["status"] == "error"])
-    unauthorized = len([r for r in results if r.get("error_type") == "unauthorized"])
-    flood_wait = len([r for r in results if r.get("error_type") == "flood_wait"])
-    twofa_required = len([r for r in results if r.get("error_type") == "twofa_required"])
-    
-    return {
-        "results": results,
-        "summary": {
-            "total_sessions": total_sessions,
-            "successfully_joined": successful_joins,
-            "already_in_folder": already_in_folder,
-            "errors": errors,
-            "unauthorized": unauthorized,
-            "flood_wait": flood_wait,
-            "twofa_required": twofa_required
-        },
-        "folder_info": {
-            "slug": slug,
-            "link": folder_link
-        }
-    }
+            return JoinResult(
+                session=filename,
+                status="error",
+                error=str(e),
+                error_type="general_error"
+            )
+            
+        finally:
+            if client is not None:
+                client_pool.release(client)
@@ -2,33 +2,112 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 from typing import List, Dict
 import asyncio
 import logging
-from utils.session_utils import create_telegram_client
+import re
+from config import HEALTH_CHECK_WORKERS
+from utils.session_utils import save_session_upload
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore, run_workers
+from utils.error_handler import classify_error, SESSION_ERROR_RULES
 from utils.logger import log_to_websocket
-from io import BytesIO
+from telethon import events
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# (pattern, error_type, description) rules for errors while talking to @SpamBot,
+# checked in order against the lowercased error message; the first match wins
+_SPAM_BOT_ERRORS = (
+    (re.compile(r'flood|wait'), "flood_wait", "Rate limited - too many requests to SpamBot"),
+    (re.compile(r'banned|blocked'), "banned", "Account is banned or blocked"),
+    (re.compile(r'deleted|removed'), "deleted", "Account has been deleted"),
+    (re.compile(r'network|connection'), "network_error", "Network connection failed"),
+)
+
+# SpamBot reply keywords mapped to (priority, status, details); all keywords
+# are found in one scan and the lowest priority number wins, so "good" still
+# beats "limited" when a reply mentions both
+_SPAM_BOT_KEYWORDS = re.compile(r'good|no limitations|limited|restricted|banned')
+_SPAM_BOT_STATUSES = {
+    "good": (0, "healthy", "No limitations detected"),
+    "no limitations": (0, "healthy", "No limitations detected"),
+    "limited": (1, "limited", "Account has limitations"),
+    "restricted": (1, "limited", "Account has limitations"),
+    "banned": (2, "banned", "Account is banned"),
+}
+_UNKNOWN_SPAM_BOT_STATUS = (3, "unknown", "Unable to determine status")
+
+# Uploads without this extension are rejected before anything is read or copied
+_SESSION_EXT = '.session'
+
+# How long to wait for @SpamBot to answer /start
+_SPAM_BOT_REPLY_TIMEOUT = 10  # seconds
+
 @router.post("/")
 async def health_check_sessions(files: List[UploadFile] = File(...)):
     """
     Check session health using @SpamBot
     """
-    results = []
+    session_files = [file for file in files if file.filename.endswith(_SESSION_EXT)]
     
-    for file in files:
-        if not file.filename.endswith('.session'):
-            continue
-            
+    # A fixed set of workers pulls sessions from a queue; the shared semaphore
+    # also bounds live Telegram operations across all concurrent requests
+    semaphore = telegram_semaphore()
+    results = await run_workers(
+        session_files, lambda file: _check_one(file, semaphore), HEALTH_CHECK_WORKERS
+    )
+    
+    return {
+        "message": f"Health checked {len(results)} sessions",
+        "results": results,
+        "total_sessions": len(results)
+    }
+
+def _classify_spam_bot_reply(message_text: str):
+    """
+    Map a lowercased SpamBot reply to a (status, details) pair
+    """
+    best = _UNKNOWN_SPAM_BOT_STATUS
+    for match in _SPAM_BOT_KEYWORDS.finditer(message_text):
+        candidate = _SPAM_BOT_STATUSES[match.group()]
+        if candidate[0] < best[0]:
+            best = candidate
+            if best[0] == 0:
+                break
+    return best[1], best[2]
+
+async def _ask_spam_bot(client, spam_bot, text: str):
+    """
+    Send text to @SpamBot and return its reply, or None if it does not answer in time
+    """
+    reply_future = asyncio.get_running_loop().create_future()
+    
+    async def on_reply(event):
+        if not reply_future.done():
+            reply_future.set_result(event.message)
+    
+    # Subscribe before sending so a fast reply is not missed
+    client.add_event_handler(on_reply, events.NewMessage(incoming=True, from_users=spam_bot))
+    
+    try:
+        await client.send_message(spam_bot, text)
+        return await asyncio.wait_for(reply_future, timeout=_SPAM_BOT_REPLY_TIMEOUT)
+    except asyncio.TimeoutError:
+        return None
+    finally:
+        client.remove_event_handler(on_reply)
+
+async def _check_one(file: UploadFile, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Check the health of a single session and return its result entry
+    """
+    async with semaphore:
+        client = None
         try:
-            session_content = await file.read()
-            session_buffer = BytesIO(session_content)
-            
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, file.filename)
+            # Copy the upload to disk instead of buffering it in memory
+            session_path = await save_session_upload(file)
             
-            # Try to connect and check with SpamBot
-            await client.connect()
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, file.filename)
             
             # Add debugging
             logger.info(f"Connected to Telegram for {file.filename}")
@@ -38,135 +117,68 @@ async def health_check_sessions(files: List[UploadFile] = File(...)):
             
             if is_authorized:
                 try:
-                    # Send /start to @SpamBot
-                    spam_bot = await client.get_entity("@SpamBot")
-                    result = await client.send_message(spam_bot, "/start")
+                    # Send /start to @SpamBot and wait for its reply
+                    # get_input_entity answers from the session's entity cache once
+                    # the bot is known, so repeat checks skip ResolveUsername
+                    spam_bot = await client.get_input_entity("@SpamBot")
+                    reply = await _ask_spam_bot(client, spam_bot, "/start")
                     
-                    # Wait for response
-                    await asyncio.sleep(2)
-                    
-                    # Get recent messages from SpamBot
-                    messages = await client.get_messages(spam_bot, limit=1)
-                    
-                    if messages:
-                        latest_message = messages[0]
-                        message_text = latest_message.text.lower()
+                    if reply is not None:
+                        message_text = reply.text.lower()
                         
                         # Analyze SpamBot response
-                        if "good" in message_text or "no limitations" in message_text:
-                            status = "healthy"
-                            details = "No limitations detected"
-                        elif "limited" in message_text or "restricted" in message_text:
-                            status = "limited"
-                            details = "Account has limitations"
-                        elif "banned" in message_text:
-                            status = "banned"
-                            details = "Account is banned"
-                        else:
-                            status = "unknown"
-                            details = "Unable to determine status"
+                        status, details = _classify_spam_bot_reply(message_text)
                     else:
                         status = "no_response"
                         details = "No response from SpamBot"
                         
-                    results.append({
+                    result = {
                         "session": file.filename,
                         "status": status,
                         "details": details,
-                        "spam_bot_response": latest_message.text if messages else None
-                    })
+                        "spam_bot_response": reply.text if reply is not None else None
+                    }
                     
                     await log_to_websocket(f"✅ {file.filename}: Health check completed - {status}")
                     
                 except Exception as e:
-                    error_msg = str(e).lower()
-                    
-                    # Determine specific error type for SpamBot
-                    if "flood" in error_msg or "wait" in error_msg:
-                        error_type = "flood_wait"
-                        error_description = "Rate limited - too many requests to SpamBot"
-                    elif "banned" in error_msg or "blocked" in error_msg:
-                        error_type = "banned"
-                        error_description = "Account is banned or blocked"
-                    elif "deleted" in error_msg or "removed" in error_msg:
-                        error_type = "deleted"
-                        error_description = "Account has been deleted"
-                    elif "network" in error_msg or "connection" in error_msg:
-                        error_type = "network_error"
-                        error_description = "Network connection failed"
-                    else:
-                        error_type = "spambot_error"
-                        error_description = f"SpamBot error: {str(e)}"
+                    error_type, error_description = classify_error(
+                        e, _SPAM_BOT_ERRORS, "spambot_error", "SpamBot error"
+                    )
                     
-                    results.append({
+                    result = {
                         "session": file.filename,
                         "status": "error",
                         "error_type": error_type,
                         "details": error_description,
                         "raw_error": str(e),
                         "spam_bot_response": None
-                    })
+                    }
                     await log_to_websocket(f"❌ {file.filename}: {error_description}")
             else:
-                results.append({
+                result = {
                     "session": file.filename,
                     "status": "unauthorized",
                     "details": "Session not authorized",
                     "spam_bot_response": None
-                })
+                }
                 await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
                 
         except Exception as e:
-            error_msg = str(e).lower()
+            error_type, error_description = classify_error(e, SESSION_ERROR_RULES)
             
-            # Determine specific error type
-            if "session" in error_msg and ("expired" in error_msg or "invalid" in error_msg):
-                error_type = "session_expired"
-                error_description = "Session file is expired or invalid"
-            elif "flood" in error_msg or "wait" in error_msg:
-                error_type = "flood_wait"
-                error_description = "Rate limited - too many requests"
-            elif "banned" in error_msg or "blocked" in error_msg:
-                error_type = "banned"
-                error_description = "Account is banned or blocked"
-            elif "deleted" in error_msg or "removed" in error_msg:
-                error_type = "deleted"
-                error_description = "Account has been deleted"
-            elif "network" in error_msg or "connection" in error_msg:
-                error_type = "network_error"
-                error_description = "Network connection failed"
-            elif "auth" in error_msg or "unauthorized" in error_msg:
-                error_type = "unauthorized"
-                error_description = "Session not authorized"
-            else:
-                error_type = "unknown_error"
-                error_description = f"Unknown error: {str(e)}"
-            
-            results.append({
+            result = {
                 "session": file.filename,
                 "status": "error",
                 "error_type": error_type,
                 "details": error_description,
                 "raw_error": str(e),
                 "spam_bot_response": None
-            })
+            }
             await log_to_websocket(f"❌ {file.filename}: {error_description}")
             
         finally:
-            if 'client' in locals():
-                await client.disconnect()
-                # Clean up temp file if it exists
-                try:
-                    if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                        import os
-                        if os.path.exists(client.session.filename):
-                            os.unlink(client.session.filename)
-                            logger.info(f"Cleaned up temp file for {file.filename}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file for {file.filename}: {e}")
-    
-    return {
-        "message": f"Health checked {len(results)} sessions",
-        "results": results,
-        "total_sessions": len(results)
-    } 
\ No newline at end of file
+            if client is not None:
+                client_pool.release(client)
+        
+        return result
@@ -4,14 +4,44 @@ import asyncio
 import logging
 import re
 import tempfile
-import os
 from datetime import datetime, timedelta, timezone
-from utils.session_utils import create_telegram_client
-from io import BytesIO
+from telethon import events
+from utils.session_utils import save_session_upload
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
+from utils.error_handler import classify_error, SESSION_ERROR_RULES
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# (pattern, error_type, description) rules for errors while reading account info,
+# checked in order against the lowercased error message; the first match wins
+_EXTRACTION_ERRORS = (
+    (re.compile(r'flood|wait'), "flood_wait", "Rate limited - too many requests"),
+    (re.compile(r'banned|blocked'), "banned", "Account is banned or blocked"),
+    (re.compile(r'deleted|removed'), "deleted", "Account has been deleted"),
+    (re.compile(r'network|connection'), "network_error", "Network connection failed"),
+)
+
+# Uploads without this extension are rejected before anything is read or copied
+_SESSION_EXT = '.session'
+
+# How far back to look for an already delivered code, and how long to wait for a new one
+_RECENT_CODE_WINDOW = timedelta(minutes=10)
+_CODE_WAIT_TIMEOUT = 300  # seconds
+
+# History scan: a small first page, then larger ones, never more than 50 messages
+_HISTORY_FIRST_PAGE = 5
+_HISTORY_PAGE = 20
+_HISTORY_SCAN_LIMIT = 50
+
+# Login code patterns, tried in order; the code appears to be 5 digits like "37981"
+_CODE_PATTERNS = (
+    re.compile(r'login code:\s*(\d{5})', re.IGNORECASE),  # "Login code: 37981"
+    re.compile(r'code:\s*(\d{5})', re.IGNORECASE),        # "code: 37981"
+    re.compile(r'(\d{5})'),                                # Just the 5-digit code
+)
+
 @router.post("/login-details")
 async def get_login_details(session_file: UploadFile = File(...)):
     """
@@ -19,19 +49,14 @@ async def get_login_details(session_file: UploadFile = File(...)):
     """
     try:
         # Validate file extension
-        if not session_file.filename.endswith('.session'):
+        if not session_file.filename.endswith(_SESSION_EXT):
             raise HTTPException(status_code=400, detail="File must be a .session file")
         
-        # Read session file content into memory
-        session_content = await session_file.read()
-        session_buffer = BytesIO(session_content)
-        
-        # Create Telegram client
-        client = await create_telegram_client(session_buffer, session_file.filename)
+        # Save session file to a temporary path
+        session_path = await save_session_upload(session_file)
         
-        try:
-            await client.connect()
-            
+        # Get a connected client (reused if this session is already pooled)
+        async with client_pool.connected(session_path, session_file.filename) as client:
             if not await client.is_user_authorized():
                 raise HTTPException(status_code=401, detail="Session is not authorized")
             
@@ -52,17 +77,6 @@ async def get_login_details(session_file: UploadFile = File(...)):
                 "status": "Login details retrieved successfully"
             }
             
-        finally:
-            await client.disconnect()
-            # Clean up temp file if it exists
-            try:
-                if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                    if os.path.exists(client.session.filename):
-                        os.unlink(client.session.filename)
-                        logger.info(f"Cleaned up temp file for {session_file.filename}")
-            except Exception as e:
-                logger.warning(f"Failed to cleanup temp file for {session_file.filename}: {e}")
-            
     except HTTPException:
         raise
     except Exception as e:
@@ -75,19 +89,14 @@ async def get_login_code(session_file: UploadFile = File(...)):
     """
     try:
         # Validate file extension
-        if not session_file.filename.endswith('.session'):
+        if not session_file.filename.endswith(_SESSION_EXT):
             raise HTTPException(status_code=400, detail="File must be a .session file")
         
-        # Read session file content into memory
-        session_content = await session_file.read()
-        session_buffer = BytesIO(session_content)
+        # Save session file to a temporary path
+        session_path = await save_session_upload(session_file)
         
-        # Create Telegram client
-        client = await create_telegram_client(session_buffer, session_file.filename)
-        
-        try:
-            await client.connect()
-            
+        # Get a connected client (reused if this session is already pooled)
+        async with client_pool.connected(session_path, session_file.filename) as client:
             if not await client.is_user_authorized():
                 raise HTTPException(status_code=401, detail="Session is not authorized")
             
@@ -103,17 +112,6 @@ async def get_login_code(session_file: UploadFile = File(...)):
                 "status": "Login code retrieved successfully"
             }
             
-        finally:
-            await client.disconnect()
-            # Clean up temp file if it exists
-            try:
-                if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                    if os.path.exists(client.session.filename):
-                        os.unlink(client.session.filename)
-                        logger.info(f"Cleaned up temp file for {session_file.filename}")
-            except Exception as e:
-                logger.warning(f"Failed to cleanup temp file for {session_file.filename}: {e}")
-            
     except HTTPException:
         raise
     except Exception as e:
@@ -124,57 +122,68 @@ async def scan_for_login_code(client) -> Optional[str]:
     Scan for login code from Telegram official account (777000)
     """
     telegram_official = 777000
-    ten_minutes_ago = datetime.now(timezone.utc) - timedelta(minutes=10)
+    ten_minutes_ago = datetime.now(timezone.utc) - _RECENT_CODE_WINDOW
+    code_future = asyncio.get_running_loop().create_future()
     
-    # First, check recent messages (last 50 messages within 10 minutes)
-    try:
-        logger.info("Checking recent messages for login code...")
-        messages = await client.get_messages(telegram_official, limit=50)
-        
-        for message in messages:
-            if message.date > ten_minutes_ago:
-                code = extract_login_code(message.text)
-                if code:
-                    logger.info(f"Found recent login code: {code}")
-                    return code
-    except Exception as e:
-        logger.error(f"Error fetching recent messages: {e}")
+    async def on_new_message(event):
+        code = extract_login_code(event.raw_text)
+        if code and not code_future.done():
+            code_future.set_result(code)
     
-    # If no code found in recent messages, wait for new ones (up to 5 minutes)
-    logger.info("No recent code found. Waiting for new login code...")
-    start_time = datetime.now(timezone.utc)
-    timeout = timedelta(seconds=300)  # Wait 5 minutes
-    last_message_date = None
+    # Subscribe before the history check so a code arriving in between is not missed
+    client.add_event_handler(on_new_message, events.NewMessage(chats=telegram_official))
     
-    while datetime.now(timezone.utc) - start_time < timeout:
+    try:
+        # First, check recent messages (last 50 messages within 10 minutes)
         try:
-            # Get the latest message
-            messages = await client.get_messages(telegram_official, limit=1)
-            
-            if messages and len(messages) > 0:
-                latest_message = messages[0]
-                
-                # Check if this is a new message
-                if last_message_date is None or latest_message.date > last_message_date:
-                    last_message_date = latest_message.date
-                    
-                    # Check if message is recent enough
-                    if latest_message.date > ten_minutes_ago:
-                        code = extract_login_code(latest_message.text)
-                        if code:
-                            logger.info(f"Found new login code: {code}")
-                            return code
-                        else:
-                            logger.info(f"New message received but no code found: {latest_message.text[:50]}...")
-            
-            # Wait 3 seconds before checking again
-            await asyncio.sleep(3)
-            
+            logger.info("Checking recent messages for login code...")
+            code = await _find_recent_code(client, telegram_official, ten_minutes_ago)
+            if code:
+                logger.info(f"Found recent login code: {code}")
+                return code
         except Exception as e:
-            logger.error(f"Error scanning for new messages: {e}")
-            await asyncio.sleep(3)
+            logger.error(f"Error fetching recent messages: {e}")
+        
+        # If no code found in recent messages, wait for Telegram to push a new one (up to 5 minutes)
+        logger.info("No recent code found. Waiting for new login code...")
+        try:
+            code = await asyncio.wait_for(code_future, timeout=_CODE_WAIT_TIMEOUT)
+            logger.info(f"Found new login code: {code}")
+            return code
+        except asyncio.TimeoutError:
+            logger.info("Timeout reached while waiting for login code")
+            return None
+    finally:
+        client.remove_event_handler(on_new_message)
+
+async def _find_recent_code(client, chat, cutoff: datetime) -> Optional[str]:
+    """
+    Look for a login code in the chat history newer than cutoff, newest first.
+    The code is nearly always among the latest few messages, so history is
+    fetched in small pages and the scan stops at the first message past cutoff.
+    """
+    offset_id = 0
+    scanned = 0
+    limit = _HISTORY_FIRST_PAGE
+    
+    while scanned < _HISTORY_SCAN_LIMIT:
+        limit = min(limit, _HISTORY_SCAN_LIMIT - scanned)
+        messages = await client.get_messages(chat, limit=limit, offset_id=offset_id)
+        
+        for message in messages:
+            if message.date <= cutoff:
+                return None
+            code = extract_login_code(message.text)
+            if code:
+                return code
+        
+        if len(messages) < limit:
+            return None
+        
+        scanned += len(messages)
+        offset_id = messages[-1].id
+        limit = _HISTORY_PAGE
     
-    logger.info("Timeout reached while waiting for login code")
     return None
 
 def extract_login_code(text: str) -> Optional[str]:
@@ -184,16 +193,9 @@ def extract_login_code(text: str) -> Optional[str]:
     if not text:
         return None
     
-    # Look for login code pattern in the message
-    # The code appears to be 5 digits like "37981"
-    patterns = [
-        r'login code:\s*(\d{5})',  # "Login code: 37981"
-        r'code:\s*(\d{5})',       # "code: 37981"
-        r'(\d{5})',               # Just the 5-digit code
-    ]
-    
-    for pattern in patterns:
-        match = re.search(pattern, text, re.IGNORECASE)
+    # Look for login code pattern in the message, most specific first
+    for pattern in _CODE_PATTERNS:
+        match = pattern.search(text)
         if match:
             code = match.group(1)
             # Verify it's exactly 5 digits
@@ -207,21 +209,30 @@ async def scan_account_info(files: List[UploadFile] = File(...)):
     """
     Extract basic account information from session files (for backward compatibility)
     """
-    results = []
+    session_files = [file for file in files if file.filename.endswith(_SESSION_EXT)]
     
-    for file in files:
-        if not file.filename.endswith('.session'):
-            continue
-            
+    # Sessions are independent and network-bound, so scan them concurrently
+    semaphore = telegram_semaphore()
+    results = await asyncio.gather(*[_scan_one(file, semaphore) for file in session_files])
+    
+    return {
+        "message": f"Scanned {len(results)} sessions",
+        "results": results,
+        "total_sessions": len(results)
+    }
+
+async def _scan_one(file: UploadFile, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Extract account information from a single session file
+    """
+    async with semaphore:
+        client = None
         try:
-            session_content = await file.read()
-            session_buffer = BytesIO(session_content)
-            
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, file.filename)
+            # Copy the upload to disk instead of buffering it in memory
+            session_path = await save_session_upload(file)
             
-            # Try to connect and get account info
-            await client.connect()
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, file.filename)
             
             if await client.is_user_authorized():
                 try:
@@ -243,97 +254,47 @@ async def scan_account_info(files: List[UploadFile] = File(...)):
                         "is_fake": getattr(me, 'fake', False)
                     }
                     
-                    results.append(account_info)
+                    result = account_info
                     logger.info(f"✅ {file.filename}: Account info extracted - User ID: {me.id}")
                     
                 except Exception as e:
-                    error_msg = str(e).lower()
+                    error_type, error_description = classify_error(
+                        e, _EXTRACTION_ERRORS, "extraction_error", "Account info extraction failed"
+                    )
                     
-                    # Determine specific error type
-                    if "flood" in error_msg or "wait" in error_msg:
-                        error_type = "flood_wait"
-                        error_description = "Rate limited - too many requests"
-                    elif "banned" in error_msg or "blocked" in error_msg:
-                        error_type = "banned"
-                        error_description = "Account is banned or blocked"
-                    elif "deleted" in error_msg or "removed" in error_msg:
-                        error_type = "deleted"
-                        error_description = "Account has been deleted"
-                    elif "network" in error_msg or "connection" in error_msg:
-                        error_type = "network_error"
-                        error_description = "Network connection failed"
-                    else:
-                        error_type = "extraction_error"
-                        error_description = f"Account info extraction failed: {str(e)}"
-                    
-                    results.append({
+                    result = {
                         "session": file.filename,
                         "status": "error",
                         "error_type": error_type,
                         "error": error_description,
                         "raw_error": str(e),
                         "user_id": None
-                    })
+                    }
                     logger.error(f"❌ {file.filename}: {error_description}")
             else:
-                results.append({
+                result = {
                     "session": file.filename,
                     "status": "unauthorized",
                     "error": "Session not authorized",
                     "user_id": None
-                })
+                }
                 logger.error(f"❌ {file.filename}: Unauthorized session")
                 
         except Exception as e:
-            error_msg = str(e).lower()
+            error_type, error_description = classify_error(e, SESSION_ERROR_RULES)
             
-            # Determine specific error type
-            if "session" in error_msg and ("expired" in error_msg or "invalid" in error_msg):
-                error_type = "session_expired"
-                error_description = "Session file is expired or invalid"
-            elif "flood" in error_msg or "wait" in error_msg:
-                error_type = "flood_wait"
-                error_description = "Rate limited - too many requests"
-            elif "banned" in error_msg or "blocked" in error_msg:
-                error_type = "banned"
-                error_description = "Account is banned or blocked"
-            elif "deleted" in error_msg or "removed" in error_msg:
-                error_type = "deleted"
-                error_description = "Account has been deleted"
-            elif "network" in error_msg or "connection" in error_msg:
-                error_type = "network_error"
-                error_description = "Network connection failed"
-            elif "auth" in error_msg or "unauthorized" in error_msg:
-                error_type = "unauthorized"
-                error_description = "Session not authorized"
-            else:
-                error_type = "unknown_error"
-                error_description = f"Unknown error: {str(e)}"
-            
-            results.append({
+            result = {
                 "session": file.filename,
                 "status": "error",
                 "error_type": error_type,
                 "error": error_description,
                 "raw_error": str(e),
                 "user_id": None
-            })
+            }
             logger.error(f"❌ {file.filename}: {error_description}")
             
         finally:
-            if 'client' in locals():
-                await client.disconnect()
-                # Clean up temp file if it exists
-                try:
-                    if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                        if os.path.exists(client.session.filename):
-                            os.unlink(client.session.filename)
-                            logger.info(f"Cleaned up temp file for {file.filename}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file for {file.filename}: {e}")
-    
-    return {
-        "message": f"Scanned {len(results)} sessions",
-        "results": results,
-        "total_sessions": len(results)
-    } 
\ No newline at end of file
+            if client is not None:
+                client_pool.release(client)
+        
+        return result
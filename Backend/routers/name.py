@@ -2,14 +2,27 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from typing import List, Dict
 import asyncio
 import logging
-from utils.session_utils import create_telegram_client
+import re
+from utils.session_utils import save_session_upload, remove_session_file
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
+from utils.error_handler import classify_error, SESSION_ERROR_RULES
 from utils.logger import log_to_websocket
-from io import BytesIO
 from telethon.tl.functions.account import UpdateProfileRequest
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# (pattern, error_type, description) rules for display name update errors,
+# checked in order against the lowercased error message; the first match wins
+_NAME_UPDATE_ERRORS = (
+    (re.compile(r'flood|wait'), "flood_wait", "Rate limited - too many profile updates"),
+    (re.compile(r'banned|blocked'), "banned", "Account is banned or blocked"),
+    (re.compile(r'deleted|removed'), "deleted", "Account has been deleted"),
+    (re.compile(r'network|connection'), "network_error", "Network connection failed"),
+    (re.compile(r'first_name|name'), "name_error", "Invalid name format or length"),
+)
+
 @router.post("/set")
 async def set_names(
     files: List[UploadFile] = File(...),
@@ -24,25 +37,36 @@ async def set_names(
     except json.JSONDecodeError:
         raise HTTPException(status_code=400, detail="Invalid names JSON format")
     
-    results = []
+    session_files = [file for file in files if file.filename.endswith('.session')]
     
-    for file in files:
-        if not file.filename.endswith('.session'):
-            continue
-            
+    # Sessions are independent and network-bound, so update them concurrently
+    semaphore = telegram_semaphore()
+    results = await asyncio.gather(*[
+        _set_name(file, name_mapping, semaphore) for file in session_files
+    ])
+    
+    return {
+        "message": f"Updated names for {len(results)} sessions",
+        "results": results,
+        "total_sessions": len(results)
+    }
+
+async def _set_name(file: UploadFile, name_mapping: Dict, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Set the display name of a single session and return its result entry
+    """
+    async with semaphore:
+        session_path = None
+        client = None
         try:
-            session_content = await file.read()
-            session_buffer = BytesIO(session_content)
+            session_path = await save_session_upload(file)
             
             # Get the display name for this session
             session_name = file.filename.replace('.session', '')
             display_name = name_mapping.get(session_name, session_name)
             
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, file.filename)
-            
-            # Try to connect and update name
-            await client.connect()
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, file.filename)
             
             if await client.is_user_authorized():
                 try:
@@ -54,108 +78,54 @@ async def set_names(
                         about=""
                     ))
                     
-                    results.append({
+                    await log_to_websocket(f"✅ {file.filename}: Name updated to '{display_name}'")
+                    return {
                         "session": file.filename,
                         "status": "success",
                         "old_name": me.first_name,
                         "new_name": display_name,
                         "user_id": me.id
-                    })
-                    
-                    await log_to_websocket(f"✅ {file.filename}: Name updated to '{display_name}'")
+                    }
                     
                 except Exception as e:
-                    error_msg = str(e).lower()
+                    error_type, error_description = classify_error(
+                        e, _NAME_UPDATE_ERRORS, "update_error", "Name update failed"
+                    )
                     
-                    # Determine specific error type for name updates
-                    if "flood" in error_msg or "wait" in error_msg:
-                        error_type = "flood_wait"
-                        error_description = "Rate limited - too many profile updates"
-                    elif "banned" in error_msg or "blocked" in error_msg:
-                        error_type = "banned"
-                        error_description = "Account is banned or blocked"
-                    elif "deleted" in error_msg or "removed" in error_msg:
-                        error_type = "deleted"
-                        error_description = "Account has been deleted"
-                    elif "network" in error_msg or "connection" in error_msg:
-                        error_type = "network_error"
-                        error_description = "Network connection failed"
-                    elif "first_name" in error_msg or "name" in error_msg:
-                        error_type = "name_error"
-                        error_description = "Invalid name format or length"
-                    else:
-                        error_type = "update_error"
-                        error_description = f"Name update failed: {str(e)}"
-                    
-                    results.append({
+                    await log_to_websocket(f"❌ {file.filename}: {error_description}")
+                    return {
                         "session": file.filename,
                         "status": "error",
                         "error_type": error_type,
                         "error": error_description,
                         "raw_error": str(e),
                         "user_id": None
-                    })
-                    await log_to_websocket(f"❌ {file.filename}: {error_description}")
+                    }
             else:
-                results.append({
+                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                return {
                     "session": file.filename,
                     "status": "unauthorized",
                     "error": "Session not authorized",
                     "user_id": None
-                })
-                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                }
                 
         except Exception as e:
-            error_msg = str(e).lower()
-            
-            # Determine specific error type
-            if "session" in error_msg and ("expired" in error_msg or "invalid" in error_msg):
-                error_type = "session_expired"
-                error_description = "Session file is expired or invalid"
-            elif "flood" in error_msg or "wait" in error_msg:
-                error_type = "flood_wait"
-                error_description = "Rate limited - too many requests"
-            elif "banned" in error_msg or "blocked" in error_msg:
-                error_type = "banned"
-                error_description = "Account is banned or blocked"
-            elif "deleted" in error_msg or "removed" in error_msg:
-                error_type = "deleted"
-                error_description = "Account has been deleted"
-            elif "network" in error_msg or "connection" in error_msg:
-                error_type = "network_error"
-                error_description = "Network connection failed"
-            elif "auth" in error_msg or "unauthorized" in error_msg:
-                error_type = "unauthorized"
-                error_description = "Session not authorized"
-            else:
-                error_type = "unknown_error"
-                error_description = f"Unknown error: {str(e)}"
+            error_type, error_description = classify_error(e, SESSION_ERROR_RULES)
             
-            results.append({
+            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            return {
                 "session": file.filename,
                 "status": "error",
                 "error_type": error_type,
                 "error": error_description,
                 "raw_error": str(e),
                 "user_id": None
-            })
-            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            }
             
         finally:
-            if 'client' in locals():
-                await client.disconnect()
-                # Clean up temp file if it exists
-                try:
-                    if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                        import os
-                        if os.path.exists(client.session.filename):
-                            os.unlink(client.session.filename)
-                            logger.info(f"Cleaned up temp file for {file.filename}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file for {file.filename}: {e}")
-    
-    return {
-        "message": f"Updated names for {len(results)} sessions",
-        "results": results,
-        "total_sessions": len(results)
-    } 
\ No newline at end of file
+            if client is not None:
+                client_pool.release(client)
+            else:
+                # The pool only owns the temp file once acquire() was reached
+                await remove_session_file(session_path)
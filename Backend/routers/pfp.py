@@ -2,69 +2,63 @@ from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from typing import List, Dict
 import asyncio
 import logging
-from utils.session_utils import create_telegram_client
+from utils.session_utils import save_session_upload
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
 from utils.logger import log_to_websocket
-from io import BytesIO
-import io
 import os
 from telethon import functions
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-def validate_image_format(image_data: bytes, filename: str) -> bool:
+# Magic numbers per image extension: any one of the alternatives may match,
+# and every (offset, bytes) pair of an alternative has to be present
+_IMAGE_SIGNATURES = {
+    '.jpg': (((0, b'\xff\xd8\xff'),),),
+    '.jpeg': (((0, b'\xff\xd8\xff'),),),
+    '.png': (((0, b'\x89PNG\r\n\x1a\n'),),),
+    '.gif': (((0, b'GIF87a'),), ((0, b'GIF89a'),)),
+    '.bmp': (((0, b'BM'),),),
+    '.webp': (((0, b'RIFF'), (8, b'WEBP')),),
+}
+
+# Max profile picture size (10MB)
+MAX_IMAGE_SIZE = 10 * 1024 * 1024
+
+def _has_signature(image_data: bytes, file_ext: str) -> bool:
     """
-    Simple image format validation without external dependencies
+    Check the image data against the magic numbers of its extension
     """
-    # Check file extension
-    allowed_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-    file_ext = os.path.splitext(filename.lower())[1]
-    
-    if file_ext not in allowed_extensions:
-        return False
-    
-    # Check file size (max 10MB)
-    if len(image_data) > 10 * 1024 * 1024:
-        return False
-    
-    # Basic magic number validation for common image formats
-    if file_ext in {'.jpg', '.jpeg'}:
-        # JPEG magic numbers: FF D8 FF
-        if len(image_data) >= 3 and image_data[0:3] == b'\xff\xd8\xff':
-            return True
-    elif file_ext == '.png':
-        # PNG magic numbers: 89 50 4E 47
-        if len(image_data) >= 8 and image_data[0:8] == b'\x89PNG\r\n\x1a\n':
-            return True
-    elif file_ext == '.gif':
-        # GIF magic numbers: 47 49 46 38 (GIF8)
-        if len(image_data) >= 6 and image_data[0:6] in [b'GIF87a', b'GIF89a']:
-            return True
-    elif file_ext == '.bmp':
-        # BMP magic numbers: 42 4D (BM)
-        if len(image_data) >= 2 and image_data[0:2] == b'BM':
-            return True
-    elif file_ext == '.webp':
-        # WebP magic numbers: 52 49 46 46 ... 57 45 42 50
-        if len(image_data) >= 12 and image_data[0:4] == b'RIFF' and image_data[8:12] == b'WEBP':
-            return True
-    
-    # If we can't validate the magic numbers, accept based on extension
-    return True
+    return any(
+        all(image_data.startswith(signature, offset) for offset, signature in alternative)
+        for alternative in _IMAGE_SIGNATURES.get(file_ext, ())
+    )
 
-def verify_jpg_format(image_data: bytes) -> bool:
+# Extensions whose magic numbers are enforced; other formats get the
+# benefit of the doubt when their header can't be validated
+_STRICT_SIGNATURE_EXTENSIONS = {'.jpg', '.jpeg'}
+
+def validate_profile_picture(image_data: bytes, filename: str):
     """
-    Verify if the image data is actually a valid JPG file
+    Validate the profile picture extension, size and, for JPG files, magic
+    numbers in a single pass, raising an HTTPException when it is rejected
     """
-    # JPG magic numbers: FF D8 FF
-    if len(image_data) < 3:
-        return False
+    file_ext = os.path.splitext(filename.lower())[1]
     
-    # Check for JPG magic numbers
-    if image_data[0:3] == b'\xff\xd8\xff':
-        return True
+    # Check file extension and size (max 10MB)
+    if file_ext not in _IMAGE_SIGNATURES or len(image_data) > MAX_IMAGE_SIZE:
+        raise HTTPException(
+            status_code=400, 
+            detail="Invalid image format or size. Supported: JPG, PNG, GIF, BMP, WebP, max 10MB"
+        )
     
-    return False
+    # Additional validation for JPG files
+    if file_ext in _STRICT_SIGNATURE_EXTENSIONS and not _has_signature(image_data, file_ext):
+        raise HTTPException(
+            status_code=400,
+            detail="The file appears to be corrupted or not a valid JPG image. Please try converting your image again."
+        )
 
 @router.post("/update_profile_picture")
 async def update_profile_picture(
@@ -86,57 +80,32 @@ async def update_profile_picture(
         # Read image data
         image_data = await profile_picture.read()
         
-        # Validate image format and size
-        if not validate_image_format(image_data, profile_picture.filename):
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid image format or size. Supported: JPG, PNG, GIF, BMP, WebP, max 10MB"
-            )
+        # Validate image format, size and magic numbers
+        validate_profile_picture(image_data, profile_picture.filename)
         
-        # Additional validation for JPG files
-        if profile_picture.filename.lower().endswith(('.jpg', '.jpeg')):
-            if not verify_jpg_format(image_data):
-                raise HTTPException(
-                    status_code=400,
-                    detail="The file appears to be corrupted or not a valid JPG image. Please try converting your image again."
-                )
+        # Copy the upload to disk instead of buffering it in memory
+        session_path = await save_session_upload(session_file)
         
-        # Create Telegram client
-        session_content = await session_file.read()
-        session_buffer = BytesIO(session_content)
-        client = await create_telegram_client(session_buffer, session_file.filename)
-        
-        try:
-            # Connect to Telegram
-            await client.connect()
-            
+        # Get a connected client (reused if this session is already pooled)
+        async with client_pool.connected(session_path, session_file.filename) as client:
             # Check if authorized
             if not await client.is_user_authorized():
                 raise HTTPException(status_code=401, detail="Session not authorized")
             
             # Update profile picture
-            # Convert image data back to BytesIO for Telegram
-            image_io = BytesIO(image_data)
-            image_io.seek(0)
-            
-            # Upload profile picture using the correct Telethon method
-            uploaded_file = await client.upload_file(image_io)
+            # upload_file takes the bytes as-is, so every session uploads
+            # from the same buffer without copying it
+            uploaded_file = await client.upload_file(image_data)
             result = await client(functions.photos.UploadProfilePhotoRequest(
                 file=uploaded_file
             ))
             
-            await client.disconnect()
-            
             return {
                 "status": "success",
                 "message": "Profile picture updated successfully",
                 "photo_id": str(result.id) if result else None
             }
             
-        except Exception as e:
-            await client.disconnect()
-            raise e
-            
     except HTTPException:
         raise
     except Exception as e:
@@ -151,8 +120,6 @@ async def update_multiple_profile_pictures(
     """
     Update profile picture for multiple Telegram sessions
     """
-    results = []
-    
     # Validate profile picture first
     if not profile_picture.filename:
         raise HTTPException(status_code=400, detail="Profile picture filename is required")
@@ -160,105 +127,96 @@ async def update_multiple_profile_pictures(
     # Read image data once
     image_data = await profile_picture.read()
     
-    # Validate image format and size
-    if not validate_image_format(image_data, profile_picture.filename):
-        raise HTTPException(
-            status_code=400, 
-            detail="Invalid image format or size. Supported: JPG, PNG, GIF, BMP, WebP, max 10MB"
-        )
+    # Validate image format, size and magic numbers
+    validate_profile_picture(image_data, profile_picture.filename)
     
-    # Additional validation for JPG files
-    if profile_picture.filename.lower().endswith(('.jpg', '.jpeg')):
-        if not verify_jpg_format(image_data):
-            raise HTTPException(
-                status_code=400,
-                detail="The file appears to be corrupted or not a valid JPG image. Please try converting your image again."
-            )
+    # Sessions are independent and network-bound, so update them concurrently
+    semaphore = telegram_semaphore()
+    results = await asyncio.gather(*[
+        _update_one(session_file, image_data, semaphore) for session_file in session_files
+    ])
+    
+    # Calculate summary
+    total_sessions = len(session_files)
+    successful_updates = len([r for r in results if r["status"] == "success"])
+    errors = len([r for r in results if r["status"] == "error"])
+    unauthorized = len([r for r in results if r.get("error_type") == "unauthorized"])
+    
+    return {
+        "results": results,
+        "summary": {
+            "total_sessions": total_sessions,
+            "successfully_updated": successful_updates,
+            "errors": errors,
+            "unauthorized": unauthorized
+        }
+    }
+
+async def _update_one(session_file: UploadFile, image_data: bytes, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Update the profile picture of a single session and return its result entry
+    """
+    filename = session_file.filename
     
-    # Process each session file
-    for session_file in session_files:
+    # Validate session file
+    if not filename.endswith('.session'):
+        return {
+            "session": filename,
+            "status": "error",
+            "error": "Session file must have .session extension",
+            "error_type": "invalid_session"
+        }
+    
+    async with semaphore:
+        client = None
         try:
-            # Validate session file
-            if not session_file.filename.endswith('.session'):
-                results.append({
-                    "session": session_file.filename,
-                    "status": "error",
-                    "error": "Session file must have .session extension",
-                    "error_type": "invalid_session"
-                })
-                continue
+            # Copy the upload to disk instead of buffering it in memory
+            session_path = await save_session_upload(session_file)
             
-            # Read session content once
-            session_content = await session_file.read()
-            session_buffer = BytesIO(session_content)
-            
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, session_file.filename)
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, filename)
             
             try:
-                # Connect to Telegram
-                await client.connect()
-                
                 # Check if authorized
                 if not await client.is_user_authorized():
-                    results.append({
-                        "session": session_file.filename,
+                    return {
+                        "session": filename,
                         "status": "error",
                         "error": "Session not authorized",
                         "error_type": "unauthorized"
-                    })
-                    await client.disconnect()
-                    continue
+                    }
                 
                 # Update profile picture
-                # Convert image data back to BytesIO for Telegram
-                image_io = BytesIO(image_data)
-                image_io.seek(0)
-                
-                # Upload profile picture using the correct Telethon method
-                uploaded_file = await client.upload_file(image_io)
+                # upload_file takes the bytes as-is, so every session uploads
+                # from the same buffer without copying it
+                uploaded_file = await client.upload_file(image_data)
                 result = await client(functions.photos.UploadProfilePhotoRequest(
                     file=uploaded_file
                 ))
                 
-                await client.disconnect()
-                
-                results.append({
-                    "session": session_file.filename,
+                return {
+                    "session": filename,
                     "status": "success",
                     "message": "Profile picture updated successfully",
                     "photo_id": str(result.id) if result else None
-                })
+                }
                 
             except Exception as e:
-                await client.disconnect()
-                results.append({
-                    "session": session_file.filename,
+                return {
+                    "session": filename,
                     "status": "error",
                     "error": str(e),
                     "error_type": "photo_error"
-                })
+                }
                 
         except Exception as e:
-            results.append({
-                "session": session_file.filename,
+            return {
+                "session": filename,
                 "status": "error",
                 "error": str(e),
                 "error_type": "general_error"
-            })
-    
-    # Calculate summary
-    total_sessions = len(session_files)
-    successful_updates = len([r for r in results if r["status"] == "success"])
-    errors = len([r for r in results if r["status"] == "error"])
-    unauthorized = len([r for r in results if r.get("error_type") == "unauthorized"])
-    
-    return {
-        "results": results,
-        "summary": {
-            "total_sessions": total_sessions,
-            "successfully_updated": successful_updates,
-            "errors": errors,
-            "unauthorized": unauthorized
-        }
-    }
\ No newline at end of file
+            }
+            
+        finally:
+            if client is not None:
+                client_pool.release(client)
@@ -1,6 +1,8 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
+from typing import Dict, Set
+import asyncio
 import json
+from utils.json_utils import dumps as json_dumps
 import logging
 from datetime import datetime
 
@@ -10,40 +12,47 @@ router = APIRouter()
 # Global WebSocket connection manager
 class WebSocketManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Sets give O(1) add/discard however many clients follow a task
+        self.active_connections: Dict[str, Set[WebSocket]] = {}
 
     async def connect(self, websocket: WebSocket, task_id: str):
         await websocket.accept()
-        if task_id not in self.active_connections:
-            self.active_connections[task_id] = []
-        self.active_connections[task_id].append(websocket)
+        self.active_connections.setdefault(task_id, set()).add(websocket)
         logger.info(f"WebSocket connected for task {task_id}")
 
     def disconnect(self, websocket: WebSocket, task_id: str):
         if task_id in self.active_connections:
-            if websocket in self.active_connections[task_id]:
-                self.active_connections[task_id].remove(websocket)
+            self.active_connections[task_id].discard(websocket)
             if not self.active_connections[task_id]:
                 del self.active_connections[task_id]
         logger.info(f"WebSocket disconnected from task {task_id}")
 
     async def broadcast_to_task(self, message: str, task_id: str):
         if task_id in self.active_connections:
-            dead_connections = []
-            for connection in self.active_connections[task_id]:
-                try:
-                    await connection.send_text(json.dumps({
-                        "type": "log",
-                        "message": message,
-                        "timestamp": str(datetime.now())
-                    }))
-                except Exception as e:
-                    logger.error(f"Failed to send message to WebSocket: {e}")
-                    dead_connections.append(connection)
+            # Every subscriber gets the same frame, so build it once
+            payload = json_dumps({
+                "type": "log",
+                "message": message,
+                "timestamp": str(datetime.now())
+            })
             
-            # Remove dead connections
-            for dead_conn in dead_connections:
-                self.active_connections[task_id].remove(dead_conn)
+            # Send to all subscribers at once so one slow client doesn't hold up the rest;
+            # iterate over a snapshot, clients may connect while the sends are awaited
+            connections = tuple(self.active_connections[task_id])
+            results = await asyncio.gather(
+                *[connection.send_text(payload) for connection in connections],
+                return_exceptions=True
+            )
+            
+            dead_connections = set()
+            for connection, result in zip(connections, results):
+                if isinstance(result, Exception):
+                    logger.error(f"Failed to send message to WebSocket: {result}")
+                    dead_connections.add(connection)
+            
+            # Remove dead connections (the task may have emptied meanwhile)
+            if dead_connections and task_id in self.active_connections:
+                self.active_connections[task_id] -= dead_connections
 
 ws_manager = WebSocketManager()
 
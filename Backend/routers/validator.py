@@ -2,56 +2,82 @@ from fastapi import APIRouter, UploadFile, File, HTTPException
 from typing import List, Dict
 import asyncio
 import logging
-from utils.session_utils import create_telegram_client
+import os
+from utils.session_utils import save_session_upload, remove_session_file
+from utils.client_pool import client_pool
+from utils.concurrency import telegram_semaphore
+from utils.error_handler import classify_error, SESSION_ERROR_RULES
 from utils.logger import log_to_websocket
-from io import BytesIO
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Bytes read back from a saved session for the debug previews
+SESSION_PREVIEW_BYTES = 256
+
+def _read_session_header(session_path: str):
+    """
+    Return the first SESSION_PREVIEW_BYTES of a saved session and its total size
+    """
+    with open(session_path, 'rb') as session_file:
+        return session_file.read(SESSION_PREVIEW_BYTES), os.fstat(session_file.fileno()).st_size
+
+async def _log_session_preview(filename: str, session_path: str):
+    """
+    Log the size, text preview and hex preview of a saved session at debug level
+    """
+    session_content, session_size = await asyncio.to_thread(_read_session_header, session_path)
+    session_string = session_content.decode('utf-8', errors='ignore').strip()
+    
+    logger.debug("Session file %s: %d bytes", filename, session_size)
+    logger.debug("Session string preview: %s...", session_string[:50])
+    logger.debug("Is string session: %s", session_string.startswith('1:'))
+    logger.debug("Session file hex preview: %s", session_content[:20].hex())
+
 @router.post("/")
 async def validate_sessions(files: List[UploadFile] = File(...)):
     """
     Validate multiple session files by checking authentication
     """
-    results = []
+    session_files = [file for file in files if file.filename.endswith('.session')]
     
-    for file in files:
-        if not file.filename.endswith('.session'):
-            continue
-            
+    # Sessions are independent and network-bound, so validate them concurrently
+    semaphore = telegram_semaphore()
+    results = await asyncio.gather(*[_validate_one(file, semaphore) for file in session_files])
+    
+    return {
+        "message": f"Validated {len(results)} sessions",
+        "results": results,
+        "total_sessions": len(results)
+    }
+
+async def _validate_one(file: UploadFile, semaphore: asyncio.Semaphore) -> Dict:
+    """
+    Validate a single session file and return its result entry
+    """
+    async with semaphore:
+        session_path = None
+        client = None
         try:
-            session_content = await file.read()
-            session_buffer = BytesIO(session_content)
+            session_path = await save_session_upload(file)
             
-            # Debug session content
-            logger.info(f"Session file {file.filename}: {len(session_content)} bytes")
-            try:
-                session_string = session_content.decode('utf-8', errors='ignore').strip()
-                logger.info(f"Session string preview: {session_string[:50]}...")
-                logger.info(f"Is string session: {session_string.startswith('1:')}")
-            except:
-                logger.info("Session is binary format")
+            # Debug session content, only read back and decoded when debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                await _log_session_preview(file.filename, session_path)
             
-            # Show first 20 bytes as hex for debugging
-            hex_preview = session_content[:20].hex()
-            logger.info(f"Session file hex preview: {hex_preview}")
-            
-            # Create Telegram client
-            client = await create_telegram_client(session_buffer, file.filename)
-            
-            # Try to connect and get user info
-            await client.connect()
+            # Get a connected client (reused if this session is already pooled)
+            client = await client_pool.acquire(session_path, file.filename)
             
             # Add debugging
-            logger.info(f"Connected to Telegram for {file.filename}")
+            logger.debug("Connected to Telegram for %s", file.filename)
             
             is_authorized = await client.is_user_authorized()
-            logger.info(f"Authorization check for {file.filename}: {is_authorized}")
+            logger.debug("Authorization check for %s: %s", file.filename, is_authorized)
             
             if is_authorized:
                 me = await client.get_me()
-                results.append({
+                await log_to_websocket(f"✅ {file.filename}: Valid session for user {me.id}")
+                return {
                     "session": file.filename,
                     "status": "success",
                     "user_id": me.id,
@@ -59,10 +85,10 @@ async def validate_sessions(files: List[UploadFile] = File(...)):
                     "username": me.username,
                     "first_name": me.first_name,
                     "last_name": me.last_name
-                })
-                await log_to_websocket(f"✅ {file.filename}: Valid session for user {me.id}")
+                }
             else:
-                results.append({
+                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                return {
                     "session": file.filename,
                     "status": "unauthorized",
                     "user_id": None,
@@ -70,36 +96,13 @@ async def validate_sessions(files: List[UploadFile] = File(...)):
                     "username": None,
                     "first_name": None,
                     "last_name": None
-                })
-                await log_to_websocket(f"❌ {file.filename}: Unauthorized session")
+                }
                 
         except Exception as e:
-            error_msg = str(e).lower()
-            
-            # Determine specific error type
-            if "session" in error_msg and ("expired" in error_msg or "invalid" in error_msg):
-                error_type = "session_expired"
-                error_description = "Session file is expired or invalid"
-            elif "flood" in error_msg or "wait" in error_msg:
-                error_type = "flood_wait"
-                error_description = "Rate limited - too many requests"
-            elif "banned" in error_msg or "blocked" in error_msg:
-                error_type = "banned"
-                error_description = "Account is banned or blocked"
-            elif "deleted" in error_msg or "removed" in error_msg:
-                error_type = "deleted"
-                error_description = "Account has been deleted"
-            elif "network" in error_msg or "connection" in error_msg:
-                error_type = "network_error"
-                error_description = "Network connection failed"
-            elif "auth" in error_msg or "unauthorized" in error_msg:
-                error_type = "unauthorized"
-                error_description = "Session not authorized"
-            else:
-                error_type = "unknown_error"
-                error_description = f"Unknown error: {str(e)}"
+            error_type, error_description = classify_error(e, SESSION_ERROR_RULES)
             
-            results.append({
+            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            return {
                 "session": file.filename,
                 "status": "error",
                 "error_type": error_type,
@@ -110,24 +113,11 @@ async def validate_sessions(files: List[UploadFile] = File(...)):
                 "username": None,
                 "first_name": None,
                 "last_name": None
-            })
-            await log_to_websocket(f"❌ {file.filename}: {error_description}")
+            }
             
         finally:
-            if 'client' in locals():
-                await client.disconnect()
-                # Clean up temp file if it exists
-                try:
-                    if hasattr(client, 'session') and hasattr(client.session, 'filename'):
-                        import os
-                        if os.path.exists(client.session.filename):
-                            os.unlink(client.session.filename)
-                            logger.info(f"Cleaned up temp file for {file.filename}")
-                except Exception as e:
-                    logger.warning(f"Failed to cleanup temp file for {file.filename}: {e}")
-    
-    return {
-        "message": f"Validated {len(results)} sessions",
-        "results": results,
-        "total_sessions": len(results)
-    } 
\ No newline at end of file
+            if client is not None:
+                client_pool.release(client)
+            else:
+                # The pool only owns the temp file once acquire() was reached
+                await remove_session_file(session_path)
@@ -1,17 +1,168 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Form
 from fastapi.responses import StreamingResponse
 from typing import List, Optional
+import asyncio
+import tarfile
+import time
 import zipfile
 from io import BytesIO
 import logging
 import tempfile
 import os
 import json
-import base64
+import binascii
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
+# Decompressed bytes encoded per step; a multiple of 3 so the base64 of
+# consecutive chunks concatenates without padding in between
+ZIP_ENCODE_CHUNK_SIZE = 3 * (1 << 16)
+
+# Largest member size trusted from the ZIP header when pre-sizing buffers
+ZIP_PRESIZE_MAX_BYTES = 64 * 1024 * 1024
+
+# Tar archives up to this size are built in memory, larger ones spill to disk
+TAR_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+# Chunk size used when streaming a built tar archive to the client
+TAR_STREAM_CHUNK_SIZE = 1 << 16
+
+def _encode_member(zip_file: zipfile.ZipFile, filename: str):
+    """
+    Base64-encode a ZIP member without holding its decompressed content
+    in memory, returning the encoded text and the decompressed size
+    """
+    file_info = zip_file.getinfo(filename)
+    
+    # The decompressed size is known from the central directory, so allocate
+    # the whole base64 output up front instead of growing it chunk by chunk.
+    # The header is untrusted, so past the cap the buffer just grows on append
+    presize = min(file_info.file_size, ZIP_PRESIZE_MAX_BYTES)
+    encoded = bytearray(4 * ((presize + 2) // 3))
+    offset = 0
+    size = 0
+    with zip_file.open(file_info) as member:
+        while chunk := member.read(ZIP_ENCODE_CHUNK_SIZE):
+            size += len(chunk)
+            encoded_chunk = binascii.b2a_base64(chunk, newline=False)
+            encoded[offset:offset + len(encoded_chunk)] = encoded_chunk
+            offset += len(encoded_chunk)
+    
+    # Only trims anything if the member turned out shorter than the pre-size
+    del encoded[offset:]
+    return encoded.decode('ascii'), size
+
+def _list_session_files(zip_buffer) -> List[dict]:
+    """
+    Name and size of every .session member of a ZIP file
+    """
+    with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+        return [
+            {"filename": file_info.filename, "size": file_info.file_size}
+            for file_info in zip_file.filelist
+            if file_info.filename.endswith('.session')
+        ]
+
+def _extract_session_files(zip_buffer, filename_list: List[str]) -> List[dict]:
+    """
+    Base64-encoded content of the requested ZIP members, or of every
+    .session member when filename_list is empty
+    """
+    extracted_files = []
+    
+    with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+        # If no specific filenames provided, extract all session files
+        if not filename_list:
+            filename_list = [f.filename for f in zip_file.filelist if f.filename.endswith('.session')]
+        
+        for filename in filename_list:
+            try:
+                # Decompress and encode the member chunk by chunk
+                encoded_content, size = _encode_member(zip_file, filename)
+                logger.info(f"Extracted {filename}, size: {size} bytes, base64 length: {len(encoded_content)}")
+                
+                extracted_files.append({
+                    "filename": filename,
+                    "content": encoded_content,
+                    "size": size
+                })
+                
+            except KeyError:
+                logger.warning(f"File {filename} not found in ZIP")
+                continue
+            except Exception as e:
+                logger.error(f"Error extracting {filename}: {str(e)}")
+                continue
+    
+    return extracted_files
+
+def _build_session_tar(zip_buffer, filename_list: List[str]):
+    """
+    Repack the requested ZIP members, or every .session member when
+    filename_list is empty, into an uncompressed tar archive. Returns the
+    rewound archive file and the number of members it holds.
+    """
+    tar_buffer = tempfile.SpooledTemporaryFile(max_size=TAR_SPOOL_MAX_SIZE)
+    added = 0
+    
+    try:
+        with zipfile.ZipFile(zip_buffer, 'r') as zip_file, tarfile.open(fileobj=tar_buffer, mode='w') as tar:
+            # If no specific filenames provided, extract all session files
+            if not filename_list:
+                filename_list = [f.filename for f in zip_file.filelist if f.filename.endswith('.session')]
+            
+            for filename in filename_list:
+                try:
+                    file_info = zip_file.getinfo(filename)
+                except KeyError:
+                    logger.warning(f"File {filename} not found in ZIP")
+                    continue
+                
+                tar_info = tarfile.TarInfo(name=filename)
+                tar_info.size = file_info.file_size
+                tar_info.mtime = int(time.mktime(file_info.date_time + (0, 0, -1)))
+                
+                # Decompressed bytes go straight from the ZIP member into the tar
+                with zip_file.open(file_info) as member:
+                    tar.addfile(tar_info, member)
+                added += 1
+    except Exception:
+        tar_buffer.close()
+        raise
+    
+    tar_buffer.seek(0)
+    return tar_buffer, added
+
+def _iter_file(file_obj):
+    """
+    Yield a file in TAR_STREAM_CHUNK_SIZE chunks and close it afterwards
+    """
+    try:
+        while chunk := file_obj.read(TAR_STREAM_CHUNK_SIZE):
+            yield chunk
+    finally:
+        file_obj.close()
+
+def _parse_filenames(filenames: Optional[str]) -> List[str]:
+    """
+    Parse the optional JSON list of member names sent with a ZIP
+    """
+    if not filenames:
+        return []
+    
+    try:
+        return json.loads(filenames)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid filenames format")
+
+def _read_member(zip_buffer, filename: str) -> bytes:
+    """
+    Decompressed content of a single ZIP member
+    """
+    with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
+        return zip_file.read(filename)
+
 @router.post("/preview")
 async def preview_zip(file: UploadFile = File(...)):
     """
@@ -21,20 +172,13 @@ async def preview_zip(file: UploadFile = File(...)):
         if not file.filename.endswith('.zip'):
             raise HTTPException(status_code=400, detail="File must be a ZIP file")
         
-        # Read ZIP file into memory
-        zip_content = await file.read()
-        zip_buffer = BytesIO(zip_content)
+        # Read the ZIP straight from Starlette's spooled upload file, which
+        # already spills to disk past 1 MB, instead of copying it into memory
+        zip_buffer = file.file
+        zip_buffer.seek(0)
         
-        session_files = []
-        
-        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
-            for file_info in zip_file.filelist:
-                filename = file_info.filename
-                if filename.endswith('.session'):
-                    session_files.append({
-                        "filename": filename,
-                        "size": file_info.file_size
-                    })
+        # Parsing the central directory is blocking, keep it off the event loop
+        session_files = await asyncio.to_thread(_list_session_files, zip_buffer)
         
         if not session_files:
             raise HTTPException(status_code=400, detail="No .session files found in ZIP")
@@ -64,46 +208,15 @@ async def extract_session_files(
             raise HTTPException(status_code=400, detail="File must be a ZIP file")
         
         # Parse filenames if provided
-        filename_list = []
-        if filenames:
-            try:
-                filename_list = json.loads(filenames)
-            except json.JSONDecodeError:
-                raise HTTPException(status_code=400, detail="Invalid filenames format")
+        filename_list = _parse_filenames(filenames)
         
-        # Read ZIP file into memory
-        zip_content = await file.read()
-        zip_buffer = BytesIO(zip_content)
+        # Read the ZIP straight from Starlette's spooled upload file, which
+        # already spills to disk past 1 MB, instead of copying it into memory
+        zip_buffer = file.file
+        zip_buffer.seek(0)
         
-        extracted_files = []
-        
-        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
-            # If no specific filenames provided, extract all session files
-            if not filename_list:
-                filename_list = [f.filename for f in zip_file.filelist if f.filename.endswith('.session')]
-            
-            for filename in filename_list:
-                try:
-                    # Read the file from ZIP
-                    file_data = zip_file.read(filename)
-                    logger.info(f"Extracted {filename}, size: {len(file_data)} bytes")
-                    
-                    # Encode as base64
-                    encoded_content = base64.b64encode(file_data).decode('utf-8')
-                    logger.info(f"Encoded {filename}, base64 length: {len(encoded_content)}")
-                    
-                    extracted_files.append({
-                        "filename": filename,
-                        "content": encoded_content,
-                        "size": len(file_data)
-                    })
-                    
-                except KeyError:
-                    logger.warning(f"File {filename} not found in ZIP")
-                    continue
-                except Exception as e:
-                    logger.error(f"Error extracting {filename}: {str(e)}")
-                    continue
+        # Decompression and encoding are blocking, keep them off the event loop
+        extracted_files = await asyncio.to_thread(_extract_session_files, zip_buffer, filename_list)
         
         if not extracted_files:
             raise HTTPException(status_code=400, detail="No session files could be extracted")
@@ -120,6 +233,50 @@ async def extract_session_files(
         logger.error(f"Error extracting from ZIP file: {str(e)}")
         raise HTTPException(status_code=500, detail="Error extracting from ZIP file")
 
+@router.post("/extract_tar")
+async def extract_session_files_tar(
+    file: UploadFile = File(...),
+    filenames: Optional[str] = Form(None)
+):
+    """
+    Extract specific session files from ZIP as a streamed tar archive,
+    without the base64 and JSON overhead of /extract
+    """
+    try:
+        if not file.filename.endswith('.zip'):
+            raise HTTPException(status_code=400, detail="File must be a ZIP file")
+        
+        # Parse filenames if provided
+        filename_list = _parse_filenames(filenames)
+        
+        # Read the ZIP straight from Starlette's spooled upload file
+        zip_buffer = file.file
+        zip_buffer.seek(0)
+        
+        # Decompression is blocking, keep it off the event loop
+        tar_buffer, added = await asyncio.to_thread(_build_session_tar, zip_buffer, filename_list)
+        
+        if not added:
+            tar_buffer.close()
+            raise HTTPException(status_code=400, detail="No session files could be extracted")
+        
+        return StreamingResponse(
+            _iter_file(tar_buffer),
+            media_type="application/x-tar",
+            headers={
+                "Content-Disposition": "attachment; filename=sessions.tar",
+                "X-Total-Files": str(added)
+            }
+        )
+        
+    except HTTPException:
+        raise
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Invalid ZIP file")
+    except Exception as e:
+        logger.error(f"Error extracting from ZIP file: {str(e)}")
+        raise HTTPException(status_code=500, detail="Error extracting from ZIP file")
+
 @router.post("/download/{filename}")
 async def download_session_file(file: UploadFile = File(...), filename: str = ""):
     """
@@ -132,34 +289,36 @@ async def download_session_file(file: UploadFile = File(...), filename: str = ""
         if not filename.endswith('.session'):
             raise HTTPException(status_code=400, detail="Filename must be a session file")
         
-        # Read ZIP file into memory
-        zip_content = await file.read()
-        zip_buffer = BytesIO(zip_content)
-        
-        with zipfile.ZipFile(zip_buffer, 'r') as zip_file:
-            try:
-                # Read the file from ZIP
-                file_data = zip_file.read(filename)
-                
-                # Create a streaming response
-                file_buffer = BytesIO(file_data)
-                file_buffer.seek(0)
-                
-                return StreamingResponse(
-                    file_buffer,
-                    media_type="application/octet-stream",
-                    headers={
-                        "Content-Disposition": f"attachment; filename={filename}",
-                        "Content-Length": str(len(file_data))
-                    }
-                )
-                
-            except KeyError:
-                raise HTTPException(status_code=404, detail=f"File {filename} not found in ZIP")
-            except Exception as e:
-                logger.error(f"Error downloading {filename}: {str(e)}")
-                raise HTTPException(status_code=500, detail="Error downloading file")
+        # Read the ZIP straight from Starlette's spooled upload file, which
+        # already spills to disk past 1 MB, instead of copying it into memory
+        zip_buffer = file.file
+        zip_buffer.seek(0)
         
+        try:
+            # Decompression is blocking, keep it off the event loop
+            file_data = await asyncio.to_thread(_read_member, zip_buffer, filename)
+            
+            # Create a streaming response
+            file_buffer = BytesIO(file_data)
+            file_buffer.seek(0)
+            
+            return StreamingResponse(
+                file_buffer,
+                media_type="application/octet-stream",
+                headers={
+                    "Content-Disposition": f"attachment; filename={filename}",
+                    "Content-Length": str(len(file_data))
+                }
+            )
+            
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"File {filename} not found in ZIP")
+        except zipfile.BadZipFile:
+            raise
+        except Exception as e:
+            logger.error(f"Error downloading {filename}: {str(e)}")
+            raise HTTPException(status_code=500, detail="Error downloading file")
+    
     except zipfile.BadZipFile:
         raise HTTPException(status_code=400, detail="Invalid ZIP file")
     except Exception as e:
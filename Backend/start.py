@@ -6,6 +6,7 @@ Startup script for Telegram Session Manager Backend
 import os
 import sys
 import logging
+from importlib import metadata
 from pathlib import Path
 
 # Add the current directory to Python path
@@ -20,19 +21,21 @@ logger = logging.getLogger(__name__)
 
 def check_dependencies():
     """Check if all required dependencies are installed"""
+    # Distribution names, looked up in the installed package metadata
+    # so the packages don't have to be imported just to prove they exist
     required_packages = [
         'fastapi',
         'uvicorn',
         'telethon',
-        'multipart'  # Changed from python-multipart to multipart
+        'python-multipart'
     ]
     
     missing_packages = []
     
     for package in required_packages:
         try:
-            __import__(package)
-        except ImportError:
+            metadata.distribution(package)
+        except metadata.PackageNotFoundError:
             missing_packages.append(package)
     
     if missing_packages:
@@ -66,7 +69,6 @@ def start_server():
     """Start the FastAPI server"""
     try:
         import uvicorn
-        from main import app
         from config import HOST, PORT, DEBUG
         
         logger.info(f"Starting server on {HOST}:{PORT}")
@@ -77,7 +79,10 @@ def start_server():
             host=HOST,
             port=PORT,
             reload=DEBUG,
-            log_level="info"
+            log_level="info",
+            # "auto" runs on uvloop whenever it is installed (see requirements.txt)
+            # and falls back to the asyncio loop elsewhere, e.g. on Windows
+            loop="auto"
         )
         
     except Exception as e:
@@ -0,0 +1,187 @@
+"""
+Pool of connected Telegram clients
+Reuses the MTProto connection (and its handshake) when the same session
+file is uploaded again instead of connecting from scratch every request
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Set
+from telethon import TelegramClient
+from config import CLIENT_POOL_IDLE_SECONDS, CLIENT_POOL_MAX_SIZE
+from utils.session_utils import create_telegram_client_from_path, remove_session_file
+
+logger = logging.getLogger(__name__)
+
+class PooledClient:
+    """A connected client plus the bookkeeping the pool needs"""
+
+    def __init__(self, key: str, client: TelegramClient, session_path: str):
+        self.key = key
+        self.client = client
+        self.session_path = session_path
+        self.users = 0
+        self.last_used = time.monotonic()
+        # Set once the entry was replaced while in use; the last release() closes it
+        self.detached = False
+
+class ClientPool:
+    """Keeps connected clients keyed by session file fingerprint, least recently used first"""
+
+    def __init__(self, idle_timeout: float = CLIENT_POOL_IDLE_SECONDS, max_size: int = CLIENT_POOL_MAX_SIZE):
+        self.idle_timeout = idle_timeout
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, PooledClient]" = OrderedDict()
+        self._by_client: Dict[int, PooledClient] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        # Closes of detached clients started by release(), kept so they aren't garbage collected
+        self._closing: Set[asyncio.Task] = set()
+
+    async def acquire(self, session_path: str, session_name: str) -> TelegramClient:
+        """
+        Get a connected client for the session file at session_path.
+        The pool takes ownership of the file; call release() when done.
+        """
+        key = await asyncio.to_thread(_fingerprint, session_path)
+
+        # One lock per session so different sessions connect concurrently;
+        # locks live as long as the pool, they are tiny next to a client
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry.client.is_connected():
+                # Claim the entry before awaiting anything, or the reaper or a
+                # capacity eviction could close it while it still looks idle
+                self._claim(entry)
+                # Warm client: the new copy of the session file is not needed
+                await remove_session_file(session_path)
+                logger.info(f"Reusing pooled Telegram client for session: {session_name}")
+            else:
+                if entry is not None:
+                    if entry.users <= 0:
+                        await self._evict(entry)
+                    else:
+                        # Another request still holds the dead client, leave
+                        # closing it and its session file to the last release()
+                        self._detach(entry)
+
+                try:
+                    client = await create_telegram_client_from_path(session_path, session_name)
+                except Exception:
+                    await remove_session_file(session_path)
+                    raise
+
+                try:
+                    await client.connect()
+                except Exception:
+                    await _close_client(client, session_path)
+                    raise
+
+                entry = PooledClient(key, client, session_path)
+                self._entries[key] = entry
+                self._by_client[id(client)] = entry
+                self._start_reaper()
+                self._claim(entry)
+
+        await self._evict_over_capacity()
+        return entry.client
+
+    @asynccontextmanager
+    async def connected(self, session_path: str, session_name: str) -> AsyncIterator[TelegramClient]:
+        """acquire() a client for the duration of an async with block"""
+        client = await self.acquire(session_path, session_name)
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+    def release(self, client: TelegramClient):
+        """Return a client obtained from acquire() to the pool"""
+        entry = self._by_client.get(id(client))
+        if entry is not None:
+            entry.users -= 1
+            entry.last_used = time.monotonic()
+
+            if entry.detached and entry.users <= 0:
+                closing = asyncio.create_task(self._evict(entry))
+                self._closing.add(closing)
+                closing.add_done_callback(self._closing.discard)
+
+    async def close(self):
+        """Disconnect every pooled client (application shutdown)"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+        # Detached clients still in use are only reachable through _by_client
+        for entry in list(self._by_client.values()):
+            await self._evict(entry)
+
+    def _claim(self, entry: PooledClient):
+        """Count a new user of an entry and mark it most recently used"""
+        entry.users += 1
+        entry.last_used = time.monotonic()
+        self._entries.move_to_end(entry.key)
+
+    def _detach(self, entry: PooledClient):
+        """Take an in-use entry out of the pool without disconnecting its client"""
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        entry.detached = True
+
+    async def _evict(self, entry: PooledClient):
+        """Drop an entry from the pool and disconnect its client"""
+        if self._entries.get(entry.key) is entry:
+            del self._entries[entry.key]
+        self._by_client.pop(id(entry.client), None)
+        # The per-key lock is kept: a waiter woken by release() has not taken
+        # it yet, so dropping it here would let a second acquire race the first
+
+        await _close_client(entry.client, entry.session_path)
+
+    async def _evict_over_capacity(self):
+        """Disconnect least recently used idle clients while the pool is over max_size"""
+        for entry in list(self._entries.values()):
+            if len(self._entries) <= self.max_size:
+                break
+            if entry.users <= 0 and self._entries.get(entry.key) is entry:
+                logger.info(f"Evicting least recently used pooled client {entry.key}")
+                await self._evict(entry)
+
+    def _start_reaper(self):
+        if self._reaper is None or self._reaper.done():
+            self._reaper = asyncio.create_task(self._reap_idle())
+
+    async def _reap_idle(self):
+        """Background task disconnecting clients that sat unused for idle_timeout"""
+        while self._entries:
+            await asyncio.sleep(min(self.idle_timeout, 60))
+
+            now = time.monotonic()
+            for entry in list(self._entries.values()):
+                if entry.users <= 0 and now - entry.last_used >= self.idle_timeout:
+                    logger.info(f"Disconnecting idle pooled client {entry.key}")
+                    await self._evict(entry)
+
+def _fingerprint(session_path: str) -> str:
+    """Hash the session file content so re-uploads of one session share a client"""
+    with open(session_path, 'rb') as session_file:
+        return hashlib.blake2b(session_file.read(), digest_size=16).hexdigest()
+
+async def _close_client(client: TelegramClient, session_path: str):
+    """Disconnect a client and remove its temporary session file"""
+    try:
+        await client.disconnect()
+    except Exception as e:
+        logger.warning(f"Error disconnecting Telegram client: {e}")
+
+    await remove_session_file(session_path)
+
+# Global client pool
+client_pool = ClientPool()
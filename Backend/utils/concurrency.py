@@ -0,0 +1,46 @@
+"""
+Concurrency limits shared by every router that talks to Telegram
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Sequence
+from config import TELEGRAM_CONCURRENCY
+
+_telegram_semaphore: Optional[asyncio.Semaphore] = None
+
+def telegram_semaphore() -> asyncio.Semaphore:
+    """
+    Process-wide semaphore bounding concurrent Telegram session operations.
+    Created on first use so it belongs to the running event loop.
+    """
+    global _telegram_semaphore
+    if _telegram_semaphore is None:
+        _telegram_semaphore = asyncio.Semaphore(TELEGRAM_CONCURRENCY)
+    return _telegram_semaphore
+
+async def run_workers(
+    items: Sequence,
+    process: Callable[[Any], Awaitable[Any]],
+    max_workers: int
+) -> List[Any]:
+    """
+    Process items with a fixed number of worker tasks pulling from a shared
+    queue and return the results in item order
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    for index, item in enumerate(items):
+        queue.put_nowait((index, item))
+    
+    results: List[Any] = [None] * len(items)
+    
+    async def worker():
+        # The queue is filled up front, so an empty queue means the work is done
+        while True:
+            try:
+                index, item = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            results[index] = await process(item)
+    
+    await asyncio.gather(*[worker() for _ in range(min(len(items), max_workers))])
+    return results
@@ -3,11 +3,15 @@ Centralized error handler for Telethon and Telegram API errors
 Maps technical errors to human-readable messages
 """
 
+import re
+from functools import lru_cache
+from types import MappingProxyType
 from telethon.errors import RPCError
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 
 # Comprehensive error mapping for all known Telethon errors
-ERROR_MAP = {
+# (read-only, see ERROR_MAP below)
+_ERROR_MESSAGES = {
     # Authentication & Session Errors
     "AuthKeyInvalidError": "Invalid session. Please re-login to your account.",
     "AuthKeyNotFound": "Session not found. Please re-login to your account.",
@@ -98,6 +102,83 @@ ERROR_MAP = {
     "InvalidDCError": "Invalid data center. Please try again.",
 }
 
+# Shared by every router, so expose it frozen: a stray write can't change
+# the message another request gets
+ERROR_MAP = MappingProxyType(_ERROR_MESSAGES)
+
+# (pattern, error_type, description) rules for errors raised while opening or
+# using a session, checked in order against the lowercased error message
+SESSION_ERROR_RULES = (
+    (re.compile(r'^(?=.*session)(?=.*(?:expired|invalid))', re.DOTALL), "session_expired", "Session file is expired or invalid"),
+    (re.compile(r'flood|wait'), "flood_wait", "Rate limited - too many requests"),
+    (re.compile(r'banned|blocked'), "banned", "Account is banned or blocked"),
+    (re.compile(r'deleted|removed'), "deleted", "Account has been deleted"),
+    (re.compile(r'network|connection'), "network_error", "Network connection failed"),
+    (re.compile(r'auth|unauthorized'), "unauthorized", "Session not authorized"),
+)
+
+# (pattern, error_type) rules matched against the exception class name for
+# frontend categorization, checked in order; the first match wins
+_ERROR_TYPE_RULES = (
+    (re.compile(r'Flood|Wait'), "rate_limit"),
+    (re.compile(r'Auth|Session'), "authentication"),
+    (re.compile(r'^(?=.*User)(?=.*(?:Deactivated|Deleted))'), "account_status"),
+    (re.compile(r'^(?=.*Phone)(?=.*Banned)'), "account_banned"),
+    (re.compile(r'Permission|Admin|Forbidden'), "permission"),
+    (re.compile(r'Network|Timeout|Connection'), "network"),
+    (re.compile(r'File|Media|Photo'), "file_upload"),
+    (re.compile(r'Content|Format|Invalid'), "validation"),
+)
+
+# Canonical messages for RPC error codes found in the error text, in priority
+# order: when a message carries several codes the earliest entry wins
+_RPC_ERROR_MESSAGES = (
+    ("FLOOD_WAIT", "Too many requests. Please wait before trying again."),
+    ("USER_DEACTIVATED", "This account has been deactivated by Telegram."),
+    ("USER_DELETED", "This account has been deleted."),
+    ("PHONE_NUMBER_BANNED", "This phone number is banned by Telegram."),
+    ("AUTH_KEY_INVALID", "Invalid session. Please re-login to your account."),
+    ("SESSION_REVOKED", "Your session has been revoked. Please re-login to your account."),
+)
+
+# All codes in one alternation, so the message is scanned once in C; the
+# priority map then picks the winner among whatever codes were found
+_RPC_ERROR_RE = re.compile('|'.join(re.escape(code) for code, _ in _RPC_ERROR_MESSAGES))
+_RPC_ERROR_PRIORITY = {code: index for index, (code, _) in enumerate(_RPC_ERROR_MESSAGES)}
+
+def _match_rpc_error(error_message: str):
+    """
+    Canonical message for the highest priority RPC error code in error_message, or None
+    """
+    codes = _RPC_ERROR_RE.findall(error_message)
+    if not codes:
+        return None
+    return _RPC_ERROR_MESSAGES[min(_RPC_ERROR_PRIORITY[code] for code in codes)][1]
+
+def classify_error(
+    err: Exception,
+    rules=SESSION_ERROR_RULES,
+    fallback_type: str = "unknown_error",
+    fallback_prefix: str = "Unknown error"
+) -> Tuple[str, str]:
+    """
+    Map an exception to an (error_type, description) pair
+    
+    Args:
+        err: The exception that occurred
+        rules: (pattern, error_type, description) rules; the first match wins
+        fallback_type: Error type used when no rule matches
+        fallback_prefix: Description prefix used when no rule matches
+        
+    Returns:
+        (error_type, description) tuple
+    """
+    error_msg = str(err).lower()
+    for pattern, error_type, description in rules:
+        if pattern.search(error_msg):
+            return error_type, description
+    return fallback_type, f"{fallback_prefix}: {str(err)}"
+
 def format_error(err: Exception) -> str:
     """
     Format technical errors into human-readable messages
@@ -111,38 +192,12 @@ def format_error(err: Exception) -> str:
     if not err:
         return "An unexpected error occurred"
     
-    # Get the error class name
-    err_name = err.__class__.__name__
-    
-    # Check if we have a mapping for this error
-    if err_name in ERROR_MAP:
-        return ERROR_MAP[err_name]
+    detail, _ = _describe_class(err.__class__)
+    if detail is not None:
+        return detail
     
     # Handle RPCError with specific error messages
-    if isinstance(err, RPCError):
-        error_message = str(err)
-        
-        # Check for common RPC error patterns
-        if "FLOOD_WAIT" in error_message:
-            return "Too many requests. Please wait before trying again."
-        elif "USER_DEACTIVATED" in error_message:
-            return "This account has been deactivated by Telegram."
-        elif "USER_DELETED" in error_message:
-            return "This account has been deleted."
-        elif "PHONE_NUMBER_BANNED" in error_message:
-            return "This phone number is banned by Telegram."
-        elif "AUTH_KEY_INVALID" in error_message:
-            return "Invalid session. Please re-login to your account."
-        elif "SESSION_REVOKED" in error_message:
-            return "Your session has been revoked. Please re-login to your account."
-        elif "FLOOD_WAIT" in error_message:
-            return "Too many requests. Please wait before trying again."
-        else:
-            # Return a generic but helpful message
-            return f"Telegram error: {error_message}"
-    
-    # For unknown errors, provide a generic message
-    return f"An unexpected error occurred: {err_name}. Please try again or contact support."
+    return _format_rpc_error(str(err))
 
 def get_error_type(err: Exception) -> str:
     """
@@ -157,27 +212,46 @@ def get_error_type(err: Exception) -> str:
     if not err:
         return "unknown_error"
     
-    err_name = err.__class__.__name__
-    
     # Categorize errors for frontend
-    if "Flood" in err_name or "Wait" in err_name:
-        return "rate_limit"
-    elif "Auth" in err_name or "Session" in err_name:
-        return "authentication"
-    elif "User" in err_name and ("Deactivated" in err_name or "Deleted" in err_name):
-        return "account_status"
-    elif "Phone" in err_name and "Banned" in err_name:
-        return "account_banned"
-    elif "Permission" in err_name or "Admin" in err_name or "Forbidden" in err_name:
-        return "permission"
-    elif "Network" in err_name or "Timeout" in err_name or "Connection" in err_name:
-        return "network"
-    elif "File" in err_name or "Media" in err_name or "Photo" in err_name:
-        return "file_upload"
-    elif "Content" in err_name or "Format" in err_name or "Invalid" in err_name:
-        return "validation"
-    else:
-        return "general_error"
+    return _describe_class(err.__class__)[1]
+
+@lru_cache(maxsize=None)
+def _describe_class(err_class: type) -> Tuple[Optional[str], str]:
+    """
+    Human-readable detail and error type for an exception class. The detail
+    is None for unmapped RPC errors, whose message depends on the error text.
+    There are only so many error classes, so each one is resolved once.
+    """
+    err_name = err_class.__name__
+    
+    # Check if we have a mapping for this error
+    detail = ERROR_MAP.get(err_name)
+    if detail is None and not issubclass(err_class, RPCError):
+        # For unknown errors, provide a generic message
+        detail = f"An unexpected error occurred: {err_name}. Please try again or contact support."
+    
+    return detail, _categorize(err_name)
+
+def _categorize(err_name: str) -> str:
+    """
+    Error type for an exception class name, from _ERROR_TYPE_RULES
+    """
+    for pattern, error_type in _ERROR_TYPE_RULES:
+        if pattern.search(err_name):
+            return error_type
+    return "general_error"
+
+def _format_rpc_error(error_message: str) -> str:
+    """
+    Human-readable message for an RPC error without an ERROR_MAP entry
+    """
+    # Check for common RPC error patterns
+    rpc_message = _match_rpc_error(error_message)
+    if rpc_message is not None:
+        return rpc_message
+    
+    # Return a generic but helpful message
+    return f"Telegram error: {error_message}"
 
 def format_error_response(err: Exception) -> Dict[str, Any]:
     """
@@ -189,9 +263,19 @@ def format_error_response(err: Exception) -> Dict[str, Any]:
     Returns:
         Formatted error response dictionary
     """
+    technical_error = str(err)
+    
+    if not err:
+        detail, error_type = format_error(err), get_error_type(err)
+    else:
+        # One cached lookup per class; only the RPC fallback needs the error text
+        detail, error_type = _describe_class(err.__class__)
+        if detail is None:
+            detail = _format_rpc_error(technical_error)
+    
     return {
-        "detail": format_error(err),
-        "error_type": get_error_type(err),
-        "technical_error": str(err),
+        "detail": detail,
+        "error_type": error_type,
+        "technical_error": technical_error,
         "error_class": err.__class__.__name__
     }
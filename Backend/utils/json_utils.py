@@ -0,0 +1,35 @@
+"""
+JSON helpers
+Uses orjson when it is installed and falls back to the stdlib json module
+"""
+
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson.JSONDecodeError subclasses json.JSONDecodeError, so callers can
+# keep catching the stdlib exception regardless of the backend in use
+JSONDecodeError = json.JSONDecodeError
+
+# Accepts str or bytes (orjson parses UTF-8 bytes without an extra decode)
+loads = orjson.loads if orjson is not None else json.loads
+
+def _default(obj):
+    # orjson encodes datetimes natively as ISO 8601; match it on the fallback
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+def dumps(obj) -> str:
+    """
+    Serialize obj to a JSON str, e.g. for WebSocket text frames.
+    datetime values are written as ISO 8601 strings.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    # Compact separators, like orjson; broadcast frames go to every client
+    return json.dumps(obj, separators=(',', ':'), default=_default)
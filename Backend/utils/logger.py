@@ -1,27 +1,93 @@
+import asyncio
 import logging
-import json
+import time
+from utils.json_utils import dumps as json_dumps
 from datetime import datetime
-from typing import Optional
+from typing import Dict, Optional, Set
 from routers.stream import get_ws_manager
 
 logger = logging.getLogger(__name__)
 
+# The stream manager is a module-level singleton, so bind its broadcast once
+_broadcast_to_task = get_ws_manager().broadcast_to_task
+
+# How long a flusher waits for more events before sending what is queued
+LOG_FLUSH_INTERVAL = 0.01
+
+# Serialized events waiting to be sent, one queue per task with a live flusher
+_queues: Dict[str, asyncio.Queue] = {}
+# Strong references to the running flushers, the event loop only keeps weak ones
+_flusher_tasks: Set[asyncio.Task] = set()
+
+def _enqueue(payload: str, task_id: str):
+    """
+    Queue a serialized event for the task, starting its flusher if none is running
+    """
+    queue = _queues.get(task_id)
+    if queue is None:
+        queue = _queues[task_id] = asyncio.Queue()
+        flusher = asyncio.create_task(_flush(task_id, queue))
+        _flusher_tasks.add(flusher)
+        flusher.add_done_callback(_flusher_tasks.discard)
+    queue.put_nowait(payload)
+
+async def _flush(task_id: str, queue: asyncio.Queue):
+    """
+    Send the queued events of a task, coalescing each burst into a single
+    broadcast. The broadcast message is always a JSON array of event objects,
+    even for a lone event, so subscribers only ever decode one shape.
+    Exits once the queue is drained; the next event starts a new flusher.
+    """
+    try:
+        while True:
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            batch = []
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+            
+            try:
+                await _broadcast_to_task('[' + ','.join(batch) + ']', task_id)
+            except Exception as e:
+                logger.error(f"Failed to send log to WebSocket: {e}")
+            
+            # No await between the check and the removal, so nothing can be
+            # queued for this flusher after it decides to stop
+            if queue.empty():
+                return
+    finally:
+        if _queues.get(task_id) is queue:
+            del _queues[task_id]
+
+# [millisecond, ISO 8601 timestamp] of the last formatted log time
+_timestamp_cache = [0, ""]
+
+def _now_iso() -> str:
+    """
+    Current local time in ISO 8601, formatted at most once per millisecond;
+    bursts of log lines within the same tick share the string
+    """
+    now = time.time()
+    millisecond = int(now * 1000)
+    if _timestamp_cache[0] != millisecond:
+        _timestamp_cache[0] = millisecond
+        _timestamp_cache[1] = datetime.fromtimestamp(now).isoformat()
+    return _timestamp_cache[1]
+
 async def log_to_websocket(message: str, task_id: str = "default", level: str = "info"):
     """
     Send log message to WebSocket clients
     """
     try:
-        ws_manager = get_ws_manager()
-        
         log_data = {
             "type": "log",
             "level": level,
             "message": message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _now_iso(),
             "task_id": task_id
         }
         
-        await ws_manager.broadcast_to_task(json.dumps(log_data), task_id)
+        # Sent by the task's flusher, together with anything else logged meanwhile
+        _enqueue(json_dumps(log_data), task_id)
         
     except Exception as e:
         logger.error(f"Failed to send log to WebSocket: {e}")
@@ -31,29 +97,32 @@ async def log_progress(task_id: str, current: int, total: int, message: str = ""
     Log progress update to WebSocket
     """
     try:
-        ws_manager = get_ws_manager()
-        
         progress_data = {
             "type": "progress",
             "current": current,
             "total": total,
-            "percentage": int((current / total) * 100) if total > 0 else 0,
+            "percentage": current * 100 // total if total > 0 else 0,
             "message": message,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": _now_iso(),
             "task_id": task_id
         }
         
-        await ws_manager.broadcast_to_task(json.dumps(progress_data), task_id)
+        _enqueue(json_dumps(progress_data), task_id)
         
     except Exception as e:
         logger.error(f"Failed to send progress to WebSocket: {e}")
 
+# Message prefixes; without a session name the message is a single concatenation
+_ERROR_PREFIX = "❌ "
+_SUCCESS_PREFIX = "✅ "
+_INFO_PREFIX = "ℹ️ "
+
 async def log_error(task_id: str, error_message: str, session_name: str = ""):
     """
     Log error to WebSocket
     """
     await log_to_websocket(
-        f"❌ {session_name}: {error_message}" if session_name else f"❌ {error_message}",
+        f"{_ERROR_PREFIX}{session_name}: {error_message}" if session_name else _ERROR_PREFIX + error_message,
         task_id,
         "error"
     )
@@ -63,7 +132,7 @@ async def log_success(task_id: str, success_message: str, session_name: str = ""
     Log success to WebSocket
     """
     await log_to_websocket(
-        f"✅ {session_name}: {success_message}" if session_name else f"✅ {success_message}",
+        f"{_SUCCESS_PREFIX}{session_name}: {success_message}" if session_name else _SUCCESS_PREFIX + success_message,
         task_id,
         "success"
     )
@@ -73,7 +142,7 @@ async def log_info(task_id: str, info_message: str, session_name: str = ""):
     Log info to WebSocket
     """
     await log_to_websocket(
-        f"ℹ️ {session_name}: {info_message}" if session_name else f"ℹ️ {info_message}",
+        f"{_INFO_PREFIX}{session_name}: {info_message}" if session_name else _INFO_PREFIX + info_message,
         task_id,
         "info"
     )
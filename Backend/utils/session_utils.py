@@ -1,20 +1,31 @@
 import asyncio
+import hashlib
+import itertools
 import logging
 import random
 import json
 import os
-from io import BytesIO
-from typing import Optional, Dict, Any
+import tempfile
+from typing import Optional, Dict, Any, List, Callable, Awaitable
 from telethon import TelegramClient
-from telethon.sessions import StringSession
+from telethon.network import ConnectionTcpAbridged
+from telethon.sessions import SQLiteSession
 from api_pool import get_api_credentials
 
 logger = logging.getLogger(__name__)
 
+# Telethon picks up cryptg automatically for MTProto AES-IGE; the pure
+# Python fallback is many times slower, so make a missing install visible
+try:
+    import cryptg  # noqa: F401
+except ImportError:
+    logger.warning("cryptg not installed, MTProto encryption will fall back to slow pure-Python AES")
+
 class SessionManager:
     def __init__(self):
         self.api_credentials = get_api_credentials()
-        self.current_api_index = 0
+        # Round-robin in C: cycle.__next__ replaces the index bookkeeping
+        self._next_credentials = itertools.cycle(self.api_credentials).__next__
         
     def get_next_api_credentials(self) -> Dict[str, Any]:
         """
@@ -23,10 +34,7 @@ class SessionManager:
         if not self.api_credentials:
             raise ValueError("No API credentials available")
             
-        credentials = self.api_credentials[self.current_api_index]
-        self.current_api_index = (self.current_api_index + 1) % len(self.api_credentials)
-        
-        return credentials
+        return self._next_credentials()
     
     def get_random_api_credentials(self) -> Dict[str, Any]:
         """
@@ -40,37 +48,117 @@ class SessionManager:
 # Global session manager
 session_manager = SessionManager()
 
-async def create_telegram_client(session_buffer: BytesIO, session_name: str) -> TelegramClient:
+# Buffer size used when copying uploads to disk
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+async def save_session_upload(upload_file) -> str:
+    """
+    Copy an uploaded session file to a temporary file and return its path
+    """
+    # The copy is blocking file I/O, keep it off the event loop
+    return await asyncio.to_thread(_copy_to_temp_file, upload_file.file)
+
+def _copy_to_temp_file(source) -> str:
+    fd, path = tempfile.mkstemp(suffix='.session')
+    try:
+        # Copy straight from Starlette's spooled file onto the raw descriptor,
+        # skipping the buffered writer a file object would add in between
+        while chunk := source.read(UPLOAD_CHUNK_SIZE):
+            view = memoryview(chunk)
+            while view:
+                view = view[os.write(fd, view):]
+    except Exception:
+        os.close(fd)
+        os.unlink(path)
+        raise
+    
+    os.close(fd)
+    return path
+
+def upload_fingerprint(upload_file) -> str:
+    """
+    Hash the content of an uploaded session file without consuming it
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    upload_file.file.seek(0)
+    for chunk in iter(lambda: upload_file.file.read(UPLOAD_CHUNK_SIZE), b''):
+        digest.update(chunk)
+    upload_file.file.seek(0)
+    return digest.hexdigest()
+
+async def gather_unique_uploads(
+    upload_files: List,
+    process: Callable[[Any], Awaitable[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """
+    Run process concurrently once per distinct session file and return one
+    result per upload, in order. Re-uploads of the same session get a copy
+    of the first upload's result with their own "session" filename.
+    """
+    # Hashing reads the spooled uploads, which may have rolled over to disk
+    fingerprints = await asyncio.to_thread(
+        lambda: [upload_fingerprint(upload_file) for upload_file in upload_files]
+    )
+    
+    first_uploads = {}
+    for upload_file, fingerprint in zip(upload_files, fingerprints):
+        first_uploads.setdefault(fingerprint, upload_file)
+    
+    unique_results = await asyncio.gather(*[process(upload_file) for upload_file in first_uploads.values()])
+    results_by_fingerprint = dict(zip(first_uploads, unique_results))
+    
+    return [
+        {**results_by_fingerprint[fingerprint], "session": upload_file.filename}
+        for upload_file, fingerprint in zip(upload_files, fingerprints)
+    ]
+
+async def remove_session_file(session_path: Optional[str]):
     """
-    Create a Telegram client from session buffer
+    Delete a temporary session file created by save_session_upload
     """
+    if session_path:
+        # unlink is a blocking syscall, keep it off the event loop
+        await asyncio.to_thread(_unlink_if_exists, session_path)
+
+def _unlink_if_exists(path: str):
     try:
-        # Get API credentials
-        credentials = session_manager.get_next_api_credentials()
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+def _build_client(session) -> TelegramClient:
+    """
+    Create a client for an opened session with the next API credentials
+    """
+    # Get API credentials
+    credentials = session_manager.get_next_api_credentials()
+    
+    return TelegramClient(
+        session,
+        credentials['api_id'],
+        credentials['api_hash'],
+        # Abridged framing has the smallest per-packet overhead of the TCP transports
+        connection=ConnectionTcpAbridged,
+        device_model="Session Manager",
+        system_version="1.0",
+        app_version="1.0",
+        lang_code="en"
+    )
+
+async def create_telegram_client_from_path(session_path: str, session_name: str) -> TelegramClient:
+    """
+    Create a Telegram client from a session file on disk
+    """
+    try:
+        # Opening the SQLite session runs blocking queries, so do it in a
+        # worker thread and hand the ready session to the client
+        session = await asyncio.to_thread(SQLiteSession, session_path)
         
-        # Create a temporary file to load the binary session
-        import tempfile
-        import os
+        # Create client with the binary session file
+        client = _build_client(session)
         
-        with tempfile.NamedTemporaryFile(suffix='.session', delete=False) as temp_file:
-            # Write the binary session data to temp file
-            session_buffer.seek(0)
-            temp_file.write(session_buffer.read())
-            temp_file.flush()
-            
-            # Create client with the binary session file
-            client = TelegramClient(
-                temp_file.name,  # Use the temp file path directly
-                credentials['api_id'],
-                credentials['api_hash'],
-                device_model="Session Manager",
-                system_version="1.0",
-                app_version="1.0",
-                lang_code="en"
-            )
-            
-            logger.info(f"Created Telegram client for session: {session_name} using temp file: {temp_file.name}")
-            return client
+        logger.info(f"Created Telegram client for session: {session_name} using temp file: {session_path}")
+        return client
         
     except Exception as e:
         logger.error(f"Error creating Telegram client for {session_name}: {e}")
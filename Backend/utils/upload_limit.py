@@ -0,0 +1,80 @@
+"""
+Request body size limit for the session upload endpoints
+A pure ASGI middleware, so every other request and streamed response
+passes straight through without an extra task or body wrapper
+"""
+
+from typing import Tuple
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+
+class UploadTooLarge(HTTPException):
+    """Raised while a body without Content-Length is read past the limit"""
+    
+    def __init__(self, detail: str):
+        # An HTTPException, so FastAPI's body parsing re-raises it untouched
+        # and the exception handlers answer with the 413
+        super().__init__(status_code=413, detail=detail)
+
+class SessionUploadLimitMiddleware:
+    """
+    Reject POST bodies over max_bytes on paths starting with one of prefixes,
+    from Content-Length before anything is parsed, or by counting received
+    bytes when the body is sent chunked without a length
+    """
+    
+    def __init__(self, app, prefixes: Tuple[str, ...], max_bytes: int):
+        self.app = app
+        self.prefixes = prefixes
+        self.max_bytes = max_bytes
+        self.detail = f"Upload too large, limit is {max_bytes} bytes"
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = None
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                content_length = value
+                break
+        
+        if content_length is not None:
+            # The server holds the body to its declared length, so the header is enough
+            if content_length.isdigit() and int(content_length) > self.max_bytes:
+                await self._reject(scope, receive, send)
+                return
+            await self.app(scope, receive, send)
+            return
+        
+        received = 0
+        response_started = False
+        
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise UploadTooLarge(self.detail)
+            return message
+        
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except UploadTooLarge:
+            # Normally answered by the exception handlers; only reached when
+            # the limit was hit outside a route's body parsing
+            if response_started:
+                raise
+            await self._reject(scope, receive, send)
+    
+    async def _reject(self, scope, receive, send):
+        response = ORJSONResponse(status_code=413, content={"detail": self.detail})
+        await response(scope, receive, send)
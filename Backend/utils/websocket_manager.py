@@ -4,18 +4,34 @@ Handles real-time updates and live progress reporting
 """
 
 import asyncio
-import json
+import itertools
 import logging
-from typing import Dict, List, Any, Optional
+import time
+from typing import Dict, Set, Any, Optional, Union
 from datetime import datetime
 from fastapi import WebSocket, WebSocketDisconnect
 from enum import Enum
+# Message timestamps are left as datetime objects, json_dumps writes them as ISO 8601
+from utils.json_utils import dumps as json_dumps, loads as json_loads, JSONDecodeError
 
 logger = logging.getLogger(__name__)
 
+# Frames a connection may fall behind before it is dropped as too slow
+SEND_QUEUE_SIZE = 256
+# Most queued messages a connection's writer joins into one frame
+BATCH_MAX_EVENTS = 64
+
+# Seconds a ProgressTracker gathers updates before broadcasting them together
+PROGRESS_FLUSH_DELAY = 0.05
+# Seconds without updates after which an uncompleted task's tracker is dropped
+TRACKER_IDLE_EXPIRE_SECONDS = 3600
+
 def safe_dict(d):
     """Safely return a dictionary, or empty dict if None/invalid"""
-    return d if isinstance(d, dict) else {}
+    # Exact dicts and None cover nearly every call; isinstance keeps dict subclasses
+    if type(d) is dict:
+        return d
+    return {} if d is None or not isinstance(d, dict) else d
 
 class MessageType(Enum):
     """Types of WebSocket messages"""
@@ -27,25 +43,49 @@ class MessageType(Enum):
     INFO = "info"
     WARNING = "warning"
 
+# Plain str values for building messages; Enum .value is a descriptor lookup per access
+MSG_PROGRESS = MessageType.PROGRESS.value
+MSG_STATUS = MessageType.STATUS.value
+MSG_RESULT = MessageType.RESULT.value
+MSG_ERROR = MessageType.ERROR.value
+MSG_COMPLETE = MessageType.COMPLETE.value
+MSG_INFO = MessageType.INFO.value
+MSG_WARNING = MessageType.WARNING.value
+
+# Keepalive reply; clients only need the type, so the frame never changes
+_PONG_TEXT = json_dumps({"type": "pong"})
+# Reply to frames that are not a JSON object
+_INVALID_FORMAT_TEXT = json_dumps({"type": "error", "message": "Invalid message format"})
+
 class ConnectionManager:
     """Manages WebSocket connections and broadcasts messages"""
     
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
-        self.task_connections: Dict[str, List[str]] = {}  # task_id -> [connection_ids]
+        # Sets give O(1) add/discard however many clients follow a task
+        self.task_connections: Dict[str, Set[str]] = {}  # task_id -> {connection_ids}
         self.connection_tasks: Dict[str, str] = {}  # connection_id -> task_id
+        # Outgoing frames of each connection and the task writing them to its socket
+        self.send_queues: Dict[str, asyncio.Queue] = {}
+        self.writer_tasks: Dict[str, asyncio.Task] = {}
+        # Unique for the life of the process, unlike the connection count
+        self._connection_ids = itertools.count()
         
     async def connect(self, websocket: WebSocket, task_id: str):
         """Connect a new WebSocket client"""
         await websocket.accept()
         
-        connection_id = f"conn_{len(self.active_connections)}_{datetime.now().timestamp()}"
+        connection_id = f"conn_{next(self._connection_ids)}"
         self.active_connections[connection_id] = websocket
         self.connection_tasks[connection_id] = task_id
         
-        if task_id not in self.task_connections:
-            self.task_connections[task_id] = []
-        self.task_connections[task_id].append(connection_id)
+        self.task_connections.setdefault(task_id, set()).add(connection_id)
+        
+        queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.send_queues[connection_id] = queue
+        self.writer_tasks[connection_id] = asyncio.create_task(
+            self._writer_loop(connection_id, websocket, queue)
+        )
         
         logger.info(f"WebSocket connected: {connection_id} for task: {task_id}")
         
@@ -54,74 +94,143 @@ class ConnectionManager:
             "type": "info",
             "message": "Connected to Session Web 2.0",
             "task_id": task_id,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         })
         
         return connection_id
     
     def disconnect(self, connection_id: str):
         """Disconnect a WebSocket client"""
-        if connection_id in self.active_connections:
-            task_id = self.connection_tasks.get(connection_id)
-            
-            # Remove from active connections
-            del self.active_connections[connection_id]
-            del self.connection_tasks[connection_id]
+        # Remove from active connections; pop probes each dict once
+        if self.active_connections.pop(connection_id, None) is not None:
+            task_id = self.connection_tasks.pop(connection_id, None)
             
             # Remove from task connections
-            if task_id and task_id in self.task_connections:
-                self.task_connections[task_id].remove(connection_id)
-                if not self.task_connections[task_id]:
+            task_connection_ids = self.task_connections.get(task_id)
+            if task_connection_ids is not None:
+                task_connection_ids.discard(connection_id)
+                if not task_connection_ids:
                     del self.task_connections[task_id]
             
+            # Stop the writer, unless it is the one disconnecting after a failed send
+            del self.send_queues[connection_id]
+            writer = self.writer_tasks.pop(connection_id)
+            if writer is not asyncio.current_task():
+                writer.cancel()
+            
             logger.info(f"WebSocket disconnected: {connection_id}")
     
-    async def send_personal_message(self, connection_id: str, message: Dict[str, Any]):
-        """Send message to a specific connection"""
-        if connection_id in self.active_connections:
-            try:
-                websocket = self.active_connections[connection_id]
-                await websocket.send_text(json.dumps(message))
-            except Exception as e:
-                logger.error(f"Error sending message to {connection_id}: {e}")
-                self.disconnect(connection_id)
+    async def _writer_loop(self, connection_id: str, websocket: WebSocket, queue: asyncio.Queue):
+        """
+        Write the queued messages of a connection to its socket, in order.
+        Messages that piled up while a send was in flight go out together,
+        up to BATCH_MAX_EVENTS at a time, as one {"type": "batch", "events": [...]} frame.
+        """
+        # The ASGI send that send_text wraps, bound once for the connection;
+        # frames stay text because the frontend JSON.parses event.data directly
+        send = websocket.send
+        try:
+            while True:
+                text = await queue.get()
+                
+                if not queue.empty():
+                    # The queued messages are already JSON, join them rather than re-encode
+                    events = [text]
+                    while len(events) < BATCH_MAX_EVENTS and not queue.empty():
+                        events.append(queue.get_nowait())
+                    text = '{"type":"batch","events":[' + ','.join(events) + ']}'
+                
+                await send({"type": "websocket.send", "text": text})
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending message to {connection_id}: {e}")
+            self.disconnect(connection_id)
+    
+    async def send_personal_message(self, connection_id: str, message: Union[Dict[str, Any], str]):
+        """Send message to a specific connection, as a dict or already serialized JSON"""
+        await self._send_text(connection_id, message if isinstance(message, str) else json_dumps(message))
+    
+    async def _send_text(self, connection_id: str, text: str):
+        """Send an already serialized message to a specific connection"""
+        self._enqueue(connection_id, text)
+    
+    def _enqueue(self, connection_id: str, text: str):
+        """
+        Hand a frame to the writer of a connection without waiting for the socket.
+        A client that falls SEND_QUEUE_SIZE frames behind is disconnected
+        instead of stalling the producer.
+        """
+        queue = self.send_queues.get(connection_id)
+        if queue is None:
+            return
+        
+        try:
+            queue.put_nowait(text)
+        except asyncio.QueueFull:
+            logger.warning(f"Dropping slow WebSocket connection {connection_id}: send queue full")
+            self.disconnect(connection_id)
     
     async def broadcast_to_task(self, task_id: str, message: Dict[str, Any]):
         """Broadcast message to all connections for a specific task"""
-        if task_id in self.task_connections:
-            connection_ids = self.task_connections[task_id].copy()
-            for connection_id in connection_ids:
-                await self.send_personal_message(connection_id, message)
+        connection_ids = self.task_connections.get(task_id)
+        if connection_ids:
+            # Serialize once, every connection gets the same text
+            self._broadcast_text(connection_ids, json_dumps(message))
     
     async def broadcast_to_all(self, message: Dict[str, Any]):
         """Broadcast message to all active connections"""
-        connection_ids = list(self.active_connections.keys())
-        for connection_id in connection_ids:
-            await self.send_personal_message(connection_id, message)
+        self._broadcast_text(self.active_connections, json_dumps(message))
+    
+    def _broadcast_text(self, connection_ids, text: str):
+        """Queue an already serialized message for several connections"""
+        # Snapshot, dropping a slow connection changes the collection
+        for connection_id in list(connection_ids):
+            self._enqueue(connection_id, text)
 
 class ProgressTracker:
     """Tracks progress for long-running operations"""
     
-    def __init__(self, manager: ConnectionManager, task_id: str):
+    def __init__(self, manager: ConnectionManager, task_id: str, keep_history: bool = False):
         self.manager = manager
         self.task_id = task_id
         self.total_items = 0
+        self._percent_total = 0
+        self._percent_scale = 0.0
         self.completed_items = 0
         self.current_operation = ""
         self.start_time = datetime.now()
+        # time.monotonic() of the last update, read by the idle expiry
+        self.last_activity = time.monotonic()
+        self.completed_count = 0
+        self.error_count = 0
+        # Every result and error is only retained on request, long tasks
+        # would otherwise hold one dict per item just to count them
+        self.keep_history = keep_history
         self.results = []
         self.errors = []
+        # Updates not broadcast yet; a burst of them goes out as one frame
+        self._pending_progress: Optional[Dict[str, Any]] = None
+        self._pending_results = []
+        self._pending_errors = []
+        self._flush_task: Optional[asyncio.Task] = None
         
     async def update_progress(self, current: int, total: int, operation: str = ""):
         """Update progress and broadcast to task"""
         self.total_items = total
         self.completed_items = current
         self.current_operation = operation
+        self.last_activity = time.monotonic()
         
-        percentage = (current / total * 100) if total > 0 else 0
+        # Totals rarely change during a task, keep 100/total instead of dividing per update
+        if total != self._percent_total:
+            self._percent_total = total
+            self._percent_scale = 100.0 / total if total > 0 else 0.0
+        percentage = current * self._percent_scale if total > 0 else 0
         
-        message = {
-            "type": MessageType.PROGRESS.value,
+        # Only the latest progress of a burst is sent
+        self._pending_progress = {
+            "type": MSG_PROGRESS,
             "task_id": self.task_id,
             "progress": {
                 "current": current,
@@ -129,74 +238,98 @@ class ProgressTracker:
                 "percentage": round(percentage, 1),
                 "operation": operation
             },
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+    
+    async def _flush_later(self):
+        """Broadcast the pending updates once PROGRESS_FLUSH_DELAY has passed"""
+        await asyncio.sleep(PROGRESS_FLUSH_DELAY)
+        self._flush_task = None
+        await self._flush()
+    
+    async def _flush(self):
+        """
+        Broadcast the latest progress in one message, with the results and
+        errors added since the last one under "results" and "errors"
+        """
+        message = self._pending_progress
+        if message is None:
+            return
+        
+        if self._pending_results:
+            message["results"] = self._pending_results
+        if self._pending_errors:
+            message["errors"] = self._pending_errors
+        
+        self._pending_progress = None
+        self._pending_results = []
+        self._pending_errors = []
+        
         await self.manager.broadcast_to_task(self.task_id, message)
     
     async def add_result(self, item_name: str, status: str, details: str = "", data: Dict = None):
-        """Add a result and broadcast to task"""
+        """Add a result and broadcast it with the next progress update"""
         result = {
             "item": item_name,
             "status": status,
             "details": details,
             "data": data or {},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
-        self.results.append(result)
-        
-        message = {
-            "type": MessageType.RESULT.value,
-            "task_id": self.task_id,
-            "result": result
-        }
-        
-        await self.manager.broadcast_to_task(self.task_id, message)
+        self.completed_count += 1
+        if self.keep_history:
+            self.results.append(result)
+        self._pending_results.append(result)
         
         # Update progress
-        await self.update_progress(len(self.results), self.total_items, self.current_operation)
+        await self.update_progress(self.completed_count, self.total_items, self.current_operation)
     
     async def add_error(self, item_name: str, error: str, error_type: str = "error"):
-        """Add an error and broadcast to task"""
+        """Add an error and broadcast it with the next progress update"""
         error_result = {
             "item": item_name,
             "status": "error",
             "error": error,
             "error_type": error_type,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
-        self.errors.append(error_result)
-        
-        message = {
-            "type": MessageType.ERROR.value,
-            "task_id": self.task_id,
-            "error": error_result
-        }
-        
-        await self.manager.broadcast_to_task(self.task_id, message)
+        self.error_count += 1
+        if self.keep_history:
+            self.errors.append(error_result)
+        self._pending_errors.append(error_result)
         
         # Update progress
-        await self.update_progress(len(self.results) + len(self.errors), self.total_items, self.current_operation)
+        await self.update_progress(self.completed_count + self.error_count, self.total_items, self.current_operation)
     
     async def complete(self, summary: Dict[str, Any] = None):
         """Mark operation as complete and broadcast summary"""
-        duration = (datetime.now() - self.start_time).total_seconds()
+        # Send what is still pending right away, ahead of the summary
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self._flush()
+        
+        end_time = datetime.now()
+        duration = (end_time - self.start_time).total_seconds()
         
         completion_message = {
-            "type": MessageType.COMPLETE.value,
+            "type": MSG_COMPLETE,
             "task_id": self.task_id,
             "summary": {
                 "total_items": self.total_items,
-                "completed": len(self.results),
-                "errors": len(self.errors),
+                "completed": self.completed_count,
+                "errors": self.error_count,
                 "duration_seconds": round(duration, 2),
-                "start_time": self.start_time.isoformat(),
-                "end_time": datetime.now().isoformat(),
+                "start_time": self.start_time,
+                "end_time": end_time,
                 **safe_dict(summary)
             },
-            "timestamp": datetime.now().isoformat()
+            "timestamp": end_time
         }
         
         await self.manager.broadcast_to_task(self.task_id, completion_message)
@@ -207,6 +340,8 @@ class WebSocketManager:
     def __init__(self):
         self.connection_manager = ConnectionManager()
         self.active_tasks: Dict[str, ProgressTracker] = {}
+        # Idle expiry timer of each tracker, so a task that never completes can't leak it
+        self._tracker_expiries: Dict[str, asyncio.TimerHandle] = {}
     
     async def connect_client(self, websocket: WebSocket, task_id: str):
         """Connect a new client"""
@@ -217,17 +352,20 @@ class WebSocketManager:
             while True:
                 try:
                     data = await websocket.receive_text()
-                    message = json.loads(data)
-                    await self.handle_message(connection_id, message)
+                    message = json_loads(data)
                 except WebSocketDisconnect:
                     break
+                except JSONDecodeError:
+                    message = None
+                
+                if not isinstance(message, dict):
+                    await self.connection_manager.send_personal_message(connection_id, _INVALID_FORMAT_TEXT)
+                    continue
+                
+                try:
+                    await self.handle_message(connection_id, message)
                 except Exception as e:
                     logger.error(f"Error handling message from {connection_id}: {e}")
-                    await self.connection_manager.send_personal_message(connection_id, {
-                        "type": "error",
-                        "message": "Invalid message format",
-                        "timestamp": datetime.now().isoformat()
-                    })
         finally:
             self.connection_manager.disconnect(connection_id)
     
@@ -236,11 +374,8 @@ class WebSocketManager:
         message_type = message.get("type")
         
         if message_type == "ping":
-            # Respond to ping with pong
-            await self.connection_manager.send_personal_message(connection_id, {
-                "type": "pong",
-                "timestamp": datetime.now().isoformat()
-            })
+            # Respond to ping with pong, a fixed frame serialized once at import
+            await self.connection_manager.send_personal_message(connection_id, _PONG_TEXT)
         elif message_type == "subscribe":
             # Subscribe to task updates
             task_id = message.get("task_id")
@@ -248,44 +383,78 @@ class WebSocketManager:
                 # Update connection's task association
                 old_task_id = self.connection_manager.connection_tasks.get(connection_id)
                 if old_task_id and old_task_id in self.connection_manager.task_connections:
-                    self.connection_manager.task_connections[old_task_id].remove(connection_id)
+                    self.connection_manager.task_connections[old_task_id].discard(connection_id)
                 
                 self.connection_manager.connection_tasks[connection_id] = task_id
-                if task_id not in self.connection_manager.task_connections:
-                    self.connection_manager.task_connections[task_id] = []
-                self.connection_manager.task_connections[task_id].append(connection_id)
+                self.connection_manager.task_connections.setdefault(task_id, set()).add(connection_id)
                 
                 await self.connection_manager.send_personal_message(connection_id, {
                     "type": "info",
                     "message": f"Subscribed to task: {task_id}",
                     "task_id": task_id,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": datetime.now()
                 })
     
-    def create_progress_tracker(self, task_id: str) -> ProgressTracker:
-        """Create a new progress tracker for a task"""
-        tracker = ProgressTracker(self.connection_manager, task_id)
+    def create_progress_tracker(
+        self,
+        task_id: str,
+        keep_history: bool = False,
+        expire_seconds: Optional[float] = TRACKER_IDLE_EXPIRE_SECONDS
+    ) -> ProgressTracker:
+        """
+        Create a new progress tracker for a task. Unless expire_seconds is None,
+        the tracker is removed once it has gone that long without an update.
+        """
+        tracker = ProgressTracker(self.connection_manager, task_id, keep_history)
+        self._cancel_expiry(task_id)
         self.active_tasks[task_id] = tracker
+        if expire_seconds is not None:
+            self._schedule_expiry(tracker, expire_seconds, expire_seconds)
         return tracker
     
+    def _schedule_expiry(self, tracker: ProgressTracker, delay: float, expire_seconds: float):
+        self._tracker_expiries[tracker.task_id] = asyncio.get_running_loop().call_later(
+            delay, self._expire_tracker, tracker, expire_seconds
+        )
+    
+    def _expire_tracker(self, tracker: ProgressTracker, expire_seconds: float):
+        """Remove an idle tracker, or check again when it could next be idle long enough"""
+        if self.active_tasks.get(tracker.task_id) is not tracker:
+            return
+        
+        # Updates only record a timestamp; the timer is re-armed here rather than per update
+        idle_seconds = time.monotonic() - tracker.last_activity
+        if idle_seconds < expire_seconds:
+            self._schedule_expiry(tracker, expire_seconds - idle_seconds, expire_seconds)
+            return
+        
+        logger.warning(f"Progress tracker for task {tracker.task_id} expired after {expire_seconds}s without updates")
+        self.remove_progress_tracker(tracker.task_id)
+    
+    def _cancel_expiry(self, task_id: str):
+        expiry = self._tracker_expiries.pop(task_id, None)
+        if expiry is not None:
+            expiry.cancel()
+    
     def get_progress_tracker(self, task_id: str) -> Optional[ProgressTracker]:
         """Get existing progress tracker for a task"""
         return self.active_tasks.get(task_id)
     
     def remove_progress_tracker(self, task_id: str):
         """Remove progress tracker for a task"""
+        self._cancel_expiry(task_id)
         if task_id in self.active_tasks:
             del self.active_tasks[task_id]
     
     async def send_status_update(self, task_id: str, status: str, message: str, details: Dict = None):
         """Send a status update for a task"""
         status_message = {
-            "type": MessageType.STATUS.value,
+            "type": MSG_STATUS,
             "task_id": task_id,
             "status": status,
             "message": message,
             "details": details or {},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
         await self.connection_manager.broadcast_to_task(task_id, status_message)
@@ -293,11 +462,11 @@ class WebSocketManager:
     async def send_info_message(self, task_id: str, message: str, details: Dict = None):
         """Send an info message for a task"""
         info_message = {
-            "type": MessageType.INFO.value,
+            "type": MSG_INFO,
             "task_id": task_id,
             "message": message,
             "details": details or {},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
         await self.connection_manager.broadcast_to_task(task_id, info_message)
@@ -305,11 +474,11 @@ class WebSocketManager:
     async def send_warning_message(self, task_id: str, message: str, details: Dict = None):
         """Send a warning message for a task"""
         warning_message = {
-            "type": MessageType.WARNING.value,
+            "type": MSG_WARNING,
             "task_id": task_id,
             "message": message,
             "details": details or {},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": datetime.now()
         }
         
         await self.connection_manager.broadcast_to_task(task_id, warning_message)
@@ -120,7 +120,13 @@ class WebSocketManager {
    */
   handleMessage(data) {
     const { type, task_id, payload, progress, status, message } = data;
-    
+
+    // The backend joins bursts of messages into one batch frame; dispatch each in order
+    if (type === 'batch' && Array.isArray(data.events)) {
+      data.events.forEach((event) => this.handleMessage(event));
+      return;
+    }
+
     // Route message to appropriate handler
     if (type && this.messageHandlers.has(type)) {
       this.messageHandlers.get(type)(data);